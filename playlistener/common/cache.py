@@ -0,0 +1,251 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, Counter
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """Bounded, thread-safe mapping with optional expiry.
+
+    The least recently used entry is evicted once size is reached and
+    entries older than ttl seconds read as missing. Hits and misses are
+    counted for reporting.
+    """
+
+    size: int
+    ttl: Optional[float]
+    entries: "OrderedDict[K, Tuple[float, V]]"
+
+    def __init__(self, size: int, ttl: Optional[float] = None):
+        """Set bounds."""
+
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: K) -> Optional[V]:
+        """Get a live entry and mark it recently used."""
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: K, value: V, ttl: Optional[float] = None):
+        """Store an entry, evicting the oldest if full."""
+
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else float("inf")
+
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key: K) -> Optional[V]:
+        """Remove an entry."""
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def __len__(self) -> int:
+        """Count entries, including expired ones not yet evicted."""
+
+        return len(self.entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for reporting."""
+
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+# Returned by a read cache fetch when the entry's ETag still matches
+NOT_MODIFIED = object()
+
+Fetch = Callable[[Optional[str]], Tuple[Any, Optional[str]]]
+AsyncFetch = Callable[[Optional[str]], Awaitable[Tuple[Any, Optional[str]]]]
+
+
+class Flight:
+    """A request other threads can wait on."""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        """Not finished yet."""
+
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class Read:
+    """A cached response body and its validator."""
+
+    __slots__ = ("value", "etag", "expires")
+
+    def __init__(self, value: Any, etag: Optional[str], expires: float):
+        """Store the parsed value."""
+
+        self.value = value
+        self.etag = etag
+        self.expires = expires
+
+
+class ReadCache:
+    """Caches API reads per endpoint and account.
+
+    Each endpoint has its own TTL, and all entries share one LRU bound.
+    Fetches are passed the ETag of an expired entry, if it had one, and
+    may return NOT_MODIFIED to keep its value for another TTL; entries
+    without an ETag are dropped once they expire. Concurrent
+    misses for the same read wait for the first one's request instead of
+    sending their own, whether they come from threads or an event loop.
+    Errors aren't cached. Invalidating an endpoint for an account also
+    orphans reads still in flight, so a request that started before a
+    write can't repopulate the cache with stale data.
+    """
+
+    ttls: Dict[str, float]
+    entries: LRUCache[Tuple, Read]
+
+    def __init__(self, size: int, ttls: Dict[str, float]):
+        """Set the bound and each endpoint's TTL in seconds."""
+
+        self.ttls = ttls
+        self.entries = LRUCache(size)
+        self.lock = threading.Lock()
+        self.generations: Counter = Counter()
+        self.flights: Dict[Tuple, Flight] = {}
+        self.async_flights: Dict[Tuple, asyncio.Future] = {}
+
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.coalesced: Counter = Counter()
+        self.revalidated: Counter = Counter()
+
+    def key(self, endpoint: str, account: Hashable, args: Tuple) -> Tuple:
+        """Key a read under the endpoint and account's current generation."""
+
+        with self.lock:
+            return endpoint, account, self.generations[endpoint, account], args
+
+    def lookup(self, endpoint: str, key: Tuple) -> Tuple[Optional[Read], bool]:
+        """Get any entry and whether it's still fresh, counting the outcome."""
+
+        read = self.entries.get(key)
+        fresh = read is not None and read.expires > time.monotonic()
+
+        with self.lock:
+            if fresh:
+                self.hits[endpoint] += 1
+            else:
+                self.misses[endpoint] += 1
+        return read, fresh
+
+    def store(self, endpoint: str, key: Tuple, stale: Optional[Read], value: Any, etag: Optional[str]) -> Any:
+        """Cache a fetched value, or renew the stale one if it wasn't modified."""
+
+        if value is NOT_MODIFIED:
+            with self.lock:
+                self.revalidated[endpoint] += 1
+            value = stale.value
+            etag = etag or stale.etag
+
+        # Expired reads are only worth keeping if they can be revalidated
+        ttl = self.ttls[endpoint]
+        self.entries.put(key, Read(value, etag, time.monotonic() + ttl), ttl=None if etag is not None else ttl)
+        return value
+
+    def get(self, endpoint: str, account: Hashable, args: Tuple, fetch: Fetch) -> Any:
+        """Return a cached read or fetch it, once across threads."""
+
+        key = self.key(endpoint, account, args)
+        stale, fresh = self.lookup(endpoint, key)
+        if fresh:
+            return stale.value
+
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+            else:
+                self.coalesced[endpoint] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = self.store(endpoint, key, stale, *fetch(stale.etag if stale is not None else None))
+            return flight.value
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    async def aget(self, endpoint: str, account: Hashable, args: Tuple, fetch: AsyncFetch) -> Any:
+        """Asynchronous version of get, coalescing within the event loop."""
+
+        key = self.key(endpoint, account, args)
+        stale, fresh = self.lookup(endpoint, key)
+        if fresh:
+            return stale.value
+
+        flight = self.async_flights.get(key)
+        if flight is not None:
+            self.coalesced[endpoint] += 1
+            return await asyncio.shield(flight)
+
+        flight = self.async_flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = self.store(endpoint, key, stale, *await fetch(stale.etag if stale is not None else None))
+            flight.set_result(value)
+            return value
+        except BaseException as error:
+            flight.set_exception(error)
+            # Waiters get the error; retrieve it so an unwaited future doesn't warn
+            flight.exception()
+            raise
+        finally:
+            del self.async_flights[key]
+
+    def invalidate(self, account: Hashable, *endpoints: str):
+        """Forget an account's reads of some endpoints, or all of them."""
+
+        with self.lock:
+            for endpoint in endpoints or self.ttls:
+                self.generations[endpoint, account] += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Hits, misses, coalesced requests and revalidations per endpoint."""
+
+        return {
+            endpoint: {
+                "hits": self.hits[endpoint],
+                "misses": self.misses[endpoint],
+                "coalesced": self.coalesced[endpoint],
+                "revalidated": self.revalidated[endpoint]}
+            for endpoint in self.ttls}
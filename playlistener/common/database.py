@@ -0,0 +1,65 @@
+from typing import Any, Dict, Optional
+
+__all__ = (
+    "SQLITE_PRAGMAS",
+    "configure_sqlite",
+    "sqlite",
+    "postgres",)
+
+# WAL lets the web server read while the bot writes, and the busy
+# timeout makes writers queue for the lock instead of failing with
+# "database is locked". NORMAL is durable enough under WAL.
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "busy_timeout": 10000,
+    "synchronous": "normal",
+}
+
+
+def configure_sqlite(sender: Any, connection: Any, **kwargs):
+    """Apply pragmas to every new SQLite connection; connect to connection_created."""
+
+    if connection.vendor != "sqlite":
+        return
+
+    pragmas = connection.settings_dict.get("PRAGMAS", SQLITE_PRAGMAS)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+
+
+def sqlite(path: Any, pragmas: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Settings for a SQLite database, optionally overriding pragmas."""
+
+    database = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": path,
+        "OPTIONS": {"timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000}}
+    if pragmas is not None:
+        database["PRAGMAS"] = {**SQLITE_PRAGMAS, **pragmas}
+    return database
+
+
+def postgres(
+        name: str,
+        user: str,
+        password: str = "",
+        host: str = "localhost",
+        port: int = 5432,
+        max_age: int = 600) -> Dict[str, Any]:
+    """Settings for a Postgres database with persistent connections.
+
+    Connections are kept for max_age seconds and checked before reuse,
+    so a restarted server doesn't fail the first request. Requires
+    psycopg2 to be installed.
+    """
+
+    return {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": name,
+        "USER": user,
+        "PASSWORD": password,
+        "HOST": host,
+        "PORT": port,
+        "CONN_MAX_AGE": max_age,
+        "CONN_HEALTH_CHECKS": True}
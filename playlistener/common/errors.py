@@ -14,3 +14,7 @@ class UsageError(BotError):
 
 class InternalError(BotError):
     """Thrown when the bot fucks up."""
+
+
+class UnavailableError(InternalError):
+    """Thrown when a service the bot relies on is failing or too slow."""
@@ -0,0 +1,62 @@
+from django.db import close_old_connections
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+def call_with_connection(function: Callable[..., T], *args: Any) -> T:
+    """Run a callback the way Django handles a request's connection."""
+
+    close_old_connections()
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+class KeyedExecutor:
+    """Runs blocking Django code on a bounded thread pool.
+
+    Callbacks submitted under the same key run one at a time in arrival
+    order, which asyncio.Lock guarantees by waking waiters first in,
+    first out. Callbacks with different keys run in parallel up to the
+    size of the pool.
+    """
+
+    pool: ThreadPoolExecutor
+    locks: Dict[str, asyncio.Lock]
+
+    def __init__(self, workers: int):
+        """Create the pool; threads are started lazily."""
+
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="django")
+        self.locks = {}
+
+    def serialize(self, key: str) -> asyncio.Lock:
+        """Get the lock ordering work for a key."""
+
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+        return lock
+
+    async def run(self, function: Callable[..., T], *args: Any) -> T:
+        """Run a callback on the pool without ordering."""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, partial(call_with_connection, function, *args))
+
+    async def run_serialized(self, key: str, function: Callable[..., T], *args: Any) -> T:
+        """Run a callback on the pool after earlier work for the key."""
+
+        async with self.serialize(key):
+            return await self.run(function, *args)
+
+    def shutdown(self):
+        """Let running callbacks finish but accept no more."""
+
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,45 @@
+import bisect
+import hashlib
+from typing import Dict, Generic, Iterable, List, TypeVar
+
+T = TypeVar("T")
+
+
+def stable_hash(value: str) -> int:
+    """Hash that is the same in every process, unlike hash()."""
+
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing(Generic[T]):
+    """Consistent hashing of keys onto nodes.
+
+    Each node is placed at replicas points on the ring and a key belongs
+    to the first node point after its own hash. Adding or removing one of
+    M nodes therefore only moves about 1/M of the keys.
+    """
+
+    replicas: int
+    points: List[int]
+    owners: Dict[int, T]
+
+    def __init__(self, nodes: Iterable[T], replicas: int = 100):
+        """Place every node on the ring."""
+
+        self.replicas = replicas
+        self.points = []
+        self.owners = {}
+        for node in nodes:
+            for replica in range(replicas):
+                point = stable_hash(f"{node}:{replica}")
+                self.owners[point] = node
+                bisect.insort(self.points, point)
+
+    def get(self, key: str) -> T:
+        """Find the node owning a key."""
+
+        if not self.points:
+            raise LookupError("ring has no nodes")
+
+        index = bisect.bisect(self.points, stable_hash(key)) % len(self.points)
+        return self.owners[self.points[index]]
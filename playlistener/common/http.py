@@ -0,0 +1,145 @@
+import httpx
+
+import asyncio
+import contextvars
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterator, Optional
+
+from .errors import UnavailableError
+
+
+# Applies to requests and httpx alike; nothing may wait on a peer forever
+TIMEOUT_SECONDS = 10
+
+LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+TIMEOUT = httpx.Timeout(TIMEOUT_SECONDS)
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+def get_client() -> httpx.Client:
+    """Get the process-wide keep-alive client for synchronous callers."""
+
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(http2=True, limits=LIMITS, timeout=TIMEOUT)
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Get the keep-alive client bound to the running event loop."""
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(http2=True, limits=LIMITS, timeout=TIMEOUT)
+    return client
+
+
+async def close_async_client():
+    """Close the running loop's client and its pooled connections."""
+
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """Share a time budget between every request made inside the block.
+
+    The budget follows the current context, so it covers the requests
+    of one task or thread without being passed around. A nested block
+    can only shorten the budget.
+    """
+
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires if current is None else min(current, expires))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def get_timeout() -> float:
+    """Get the time left for the next request, failing if none is."""
+
+    expires = _deadline.get()
+    if expires is None:
+        return TIMEOUT_SECONDS
+
+    remaining = expires - time.monotonic()
+    if remaining <= 0:
+        raise UnavailableError("sorry, that's taking too long right now, try again in a bit!")
+    return min(remaining, TIMEOUT_SECONDS)
+
+
+class CircuitBreaker:
+    """Fails fast for keys whose requests keep failing.
+
+    After threshold consecutive failures a key's circuit opens and calls
+    are refused for cooldown seconds. Then a single trial call is let
+    through; success closes the circuit and failure reopens it for twice
+    as long, up to cooldown_max.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 15, cooldown_max: float = 300):
+        """Configure when to open and how long to stay open."""
+
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.cooldown_max = cooldown_max
+        self.failures: Dict[Hashable, int] = {}
+        self.opened: Dict[Hashable, float] = {}
+        self.durations: Dict[Hashable, float] = {}
+        self.lock = threading.Lock()
+
+    def check(self, key: Hashable, message: str):
+        """Raise UnavailableError if the key's circuit is open."""
+
+        with self.lock:
+            opened = self.opened.get(key)
+            if opened is None:
+                return
+
+            if time.monotonic() < opened + self.durations[key]:
+                raise UnavailableError(message)
+
+            # Half-open: let this call through as the trial
+            self.opened[key] = time.monotonic()
+
+    def success(self, key: Hashable):
+        """Close the circuit."""
+
+        with self.lock:
+            self.failures.pop(key, None)
+            self.opened.pop(key, None)
+            self.durations.pop(key, None)
+
+    def failure(self, key: Hashable):
+        """Count a failure, opening or reopening the circuit."""
+
+        with self.lock:
+            failures = self.failures[key] = self.failures.get(key, 0) + 1
+            if key in self.opened:
+                self.durations[key] = min(self.durations[key] * 2, self.cooldown_max)
+                self.opened[key] = time.monotonic()
+            elif failures >= self.threshold:
+                self.durations[key] = self.cooldown
+                self.opened[key] = time.monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        """Count open circuits."""
+
+        with self.lock:
+            return {"open": len(self.opened), "failing": len(self.failures)}
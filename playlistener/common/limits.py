@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Hashable, Optional
+
+
+class TokenBucket:
+    """Allows rate events per second with bursts of up to capacity.
+
+    Tokens are reserved rather than checked: a caller that finds the
+    bucket empty still takes a token, driving the balance negative, and
+    is told how long to wait for it. Callers that wait as instructed are
+    therefore served in the order they arrived.
+    """
+
+    rate: float
+    capacity: float
+
+    def __init__(self, rate: float, capacity: float):
+        """Start full."""
+
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.time_updated = time.monotonic()
+        self.time_paused = 0.0
+
+    def refill(self, now: float):
+        """Add tokens earned since the last update."""
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.time_updated) * self.rate)
+        self.time_updated = now
+
+    def reserve(self, now: Optional[float] = None) -> float:
+        """Take a token, returning seconds until it may be used."""
+
+        now = time.monotonic() if now is None else now
+        self.refill(now)
+        self.tokens -= 1
+        delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(delay, self.time_paused - now)
+
+    def refund(self):
+        """Return a token whose reservation was abandoned."""
+
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds: float):
+        """Hold every reservation until seconds from now."""
+
+        self.time_paused = max(self.time_paused, time.monotonic() + seconds)
+
+
+class RequestScheduler:
+    """Paces requests through an overall bucket and one per key.
+
+    Both synchronous and asynchronous callers are supported; waiting
+    callers are counted so queue depth and wait time can be reported.
+    """
+
+    def __init__(self, rate: float, capacity: float, key_rate: float, key_capacity: float):
+        """Configure the overall and per-key limits."""
+
+        self.bucket = TokenBucket(rate, capacity)
+        self.buckets: Dict[Hashable, TokenBucket] = {}
+        self.key_rate = key_rate
+        self.key_capacity = key_capacity
+        self.lock = threading.Lock()
+
+        self.waiting = 0
+        self.waiting_max = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.pauses = 0
+        self.refusals = 0
+
+    def reserve(self, key: Hashable, timeout: Optional[float] = None) -> Optional[float]:
+        """Reserve from both buckets and count the wait.
+
+        If the wait would exceed timeout, the tokens are returned and
+        None is returned instead so the caller can fail without waiting.
+        """
+
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.key_rate, self.key_capacity)
+
+            now = time.monotonic()
+            delay = max(self.bucket.reserve(now), bucket.reserve(now))
+            if timeout is not None and delay > timeout:
+                self.bucket.refund()
+                bucket.refund()
+                self.refusals += 1
+                return None
+            if delay > 0:
+                self.waits += 1
+                self.wait_total += delay
+                self.wait_max = max(self.wait_max, delay)
+                self.waiting += 1
+                self.waiting_max = max(self.waiting_max, self.waiting)
+            return delay
+
+    def done_waiting(self):
+        """Count a caller leaving the queue."""
+
+        with self.lock:
+            self.waiting -= 1
+
+    def wait(self, key: Hashable, timeout: Optional[float] = None) -> bool:
+        """Block the calling thread until a request may be sent.
+
+        Returns False without blocking if that would take over timeout.
+        """
+
+        delay = self.reserve(key, timeout)
+        if delay is None:
+            return False
+        if delay > 0:
+            try:
+                time.sleep(delay)
+            finally:
+                self.done_waiting()
+        return True
+
+    async def await_turn(self, key: Hashable, timeout: Optional[float] = None) -> bool:
+        """Suspend the calling task until a request may be sent."""
+
+        delay = self.reserve(key, timeout)
+        if delay is None:
+            return False
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self.done_waiting()
+        return True
+
+    def pause(self, seconds: float, key: Optional[Hashable] = None):
+        """Stop sending for a key, or for everyone, e.g. after a 429."""
+
+        with self.lock:
+            self.pauses += 1
+            if key is None:
+                self.bucket.pause(seconds)
+            elif key in self.buckets:
+                self.buckets[key].pause(seconds)
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth and wait times for reporting."""
+
+        with self.lock:
+            return {
+                "waiting": self.waiting,
+                "waiting_max": self.waiting_max,
+                "waits": self.waits,
+                "wait_average": self.wait_total / self.waits if self.waits else 0.0,
+                "wait_max": self.wait_max,
+                "pauses": self.pauses,
+                "refusals": self.refusals}
@@ -6,12 +6,27 @@ from django.http.response import HttpResponse
 from django.shortcuts import redirect, Http404
 from django.utils import timezone
 
+from asgiref.sync import sync_to_async
+
 import abc
+import asyncio
+import logging
 import random
 import string
-from typing import Any, Callable
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterable, Protocol, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class Response(Protocol):
+    """The part of a requests or httpx response used for retries."""
+
+    status_code: int
 
-import requests
+
+TOKEN_FIELDS = ("access_token", "refresh_token", "token_type", "expires_in", "scope", "time_refreshed")
 
 
 def generate_state() -> str:
@@ -51,27 +66,67 @@ class OAuthAuthorization(models.Model):
     def refresh(self):
         """Refresh the access token."""
 
-    def expired(self) -> bool:
-        """Check if the cached token is past expiry."""
+    async def arefresh(self):
+        """Refresh the access token without blocking the event loop."""
+
+        await sync_to_async(self.refresh)()
+
+    def expired(self, margin: timezone.timedelta = timezone.timedelta()) -> bool:
+        """Check if the cached token is past or within margin of expiry."""
+
+        return timezone.now() + margin >= self.time_refreshed + timezone.timedelta(seconds=self.expires_in)
+
+    def persist_refresh(self, previous: timezone.datetime) -> bool:
+        """Save refreshed tokens unless someone else refreshed first.
+
+        The row is only updated if time_refreshed is still the value we
+        refreshed from. Otherwise the winner's tokens are loaded so
+        every copy of the authorization agrees.
+        """
 
-        return timezone.now() >= self.time_refreshed + timezone.timedelta(seconds=self.expires_in)
+        if self.pk is None:
+            return True
 
-    def retry(self, request: Callable[[], requests.Response]) -> requests.Response:
+        fields = {name: getattr(self, name) for name in TOKEN_FIELDS}
+        updated = type(self).objects.filter(pk=self.pk, time_refreshed=previous).update(
+            **fields,
+            time_modified=timezone.now())
+        if not updated:
+            self.refresh_from_db(fields=TOKEN_FIELDS)
+        return bool(updated)
+
+    def retry(self, request: Callable[[], Response]) -> Response:
         """Refresh if expired or status code is 401."""
 
         just_refreshed = False
         if self.expired():
-            self.refresh()
+            tokens.refresh(self)
             just_refreshed = True
 
         response = request()
 
         if not just_refreshed and response.status_code == 401:
-            self.refresh()
+            tokens.refresh(self)
             response = request()
 
         return response
 
+    async def aretry(self, request: Callable[[], Awaitable[Response]]) -> Response:
+        """Asynchronous version of retry."""
+
+        just_refreshed = False
+        if self.expired():
+            await tokens.arefresh(self)
+            just_refreshed = True
+
+        response = await request()
+
+        if not just_refreshed and response.status_code == 401:
+            await tokens.arefresh(self)
+            response = await request()
+
+        return response
+
     def serialize(self) -> dict[str, Any]:
         """Serialize for storage in session."""
 
@@ -94,6 +149,100 @@ class OAuthAuthorization(models.Model):
             scope=data["scope"])
 
 
+class TokenManager:
+    """Coordinates access token refreshes within a process.
+
+    Refreshes of the same row are single-flight: threads take turns on
+    a per-row lock and tasks await one shared refresh. Before sending a
+    refresh the row is reloaded, and if another thread or process has
+    refreshed since our copy was loaded, its tokens are adopted instead.
+    Long-running processes should call refresh_expiring periodically so
+    requests never wait on a refresh.
+    """
+
+    margin: timezone.timedelta
+    locks: Dict[Tuple[str, int], threading.Lock]
+    tasks: Dict[Tuple[str, int], asyncio.Future]
+
+    def __init__(self, margin: timezone.timedelta = timezone.timedelta(minutes=5)):
+        """Set how long before expiry tokens are proactively refreshed."""
+
+        self.margin = margin
+        self.locks = {}
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(authorization: OAuthAuthorization) -> Tuple[str, int]:
+        """Identify the row across model instances."""
+
+        return authorization._meta.label, authorization.pk
+
+    def refresh(self, authorization: OAuthAuthorization):
+        """Refresh from a synchronous context."""
+
+        if authorization.pk is None:
+            authorization.refresh()
+            return
+
+        key = self.key(authorization)
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+
+        with lock:
+            previous = authorization.time_refreshed
+            authorization.refresh_from_db(fields=TOKEN_FIELDS)
+            if authorization.time_refreshed != previous:
+                return
+
+            authorization.refresh()
+            authorization.persist_refresh(previous)
+
+    async def arefresh(self, authorization: OAuthAuthorization):
+        """Refresh from the event loop, joining one already in flight."""
+
+        if authorization.pk is None:
+            await authorization.arefresh()
+            return
+
+        key = self.key(authorization)
+        task = self.tasks.get(key)
+        if task is None:
+            task = self.tasks[key] = asyncio.ensure_future(self._arefresh(authorization))
+            task.add_done_callback(lambda _: self.tasks.pop(key, None))
+
+        refreshed = await asyncio.shield(task)
+        if refreshed is not authorization:
+            for name in TOKEN_FIELDS:
+                setattr(authorization, name, getattr(refreshed, name))
+
+    @staticmethod
+    async def _arefresh(authorization: OAuthAuthorization) -> OAuthAuthorization:
+        """Send the shared refresh and persist it."""
+
+        previous = authorization.time_refreshed
+        await sync_to_async(authorization.refresh_from_db)(fields=TOKEN_FIELDS)
+        if authorization.time_refreshed == previous:
+            await authorization.arefresh()
+            await sync_to_async(authorization.persist_refresh)(previous)
+        return authorization
+
+    async def refresh_expiring(self, authorizations: Iterable[OAuthAuthorization]):
+        """Refresh every authorization within the margin of expiry."""
+
+        expiring = [authorization for authorization in authorizations if authorization.expired(self.margin)]
+        results = await asyncio.gather(
+            *(self.arefresh(authorization) for authorization in expiring),
+            return_exceptions=True)
+
+        for authorization, result in zip(expiring, results):
+            if isinstance(result, Exception):
+                logger.error("failed to refresh %s %s", authorization._meta.label, authorization.pk, exc_info=result)
+
+
+tokens = TokenManager()
+
+
 class OAuthStartView(View):
     """Generalized view for initiating OAuth token flow.
 
@@ -1,5 +1,5 @@
 import re
-from typing import Iterator, Optional, Tuple
+from typing import Iterator, NamedTuple, Optional, Tuple
 
 
 SPOTIFY_TRACK_LINK_PATTERN = re.compile(r"https://open\.spotify\.com/track/([\da-zA-Z]+)")
@@ -31,3 +31,80 @@ def find_spotify_track_links(message: str) -> Iterator[str]:
 
     for match in SPOTIFY_TRACK_LINK_PATTERN.finditer(message):
         yield f"spotify:track:{match.group(1)}"
+
+
+class Track(NamedTuple):
+    """The parts of a Spotify track the bot describes."""
+
+    id: Optional[str]
+    name: str
+    artists: Tuple[str, ...]
+    url: str
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Track":
+        """Pick fields from an API track object."""
+
+        return cls(
+            id=data.get("id"),
+            name=data["name"],
+            artists=tuple(artist["name"] for artist in data["artists"]),
+            url=data["external_urls"]["spotify"].strip())
+
+
+# Projection of playlist reads onto what Playlist keeps
+PLAYLIST_FIELDS = "id,name,owner(id)"
+
+
+class Playlist(NamedTuple):
+    """The parts of a Spotify playlist we check when configuring one."""
+
+    id: str
+    name: str
+    owner_id: str
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Playlist":
+        """Pick fields from a projected API playlist object."""
+
+        return cls(id=data["id"], name=data["name"], owner_id=data["owner"]["id"])
+
+
+class Account(NamedTuple):
+    """The parts of a Spotify user shown when authorizing."""
+
+    id: str
+    display_name: Optional[str]
+    url: str
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Account":
+        """Pick fields from an API user object."""
+
+        return cls(id=data["id"], display_name=data.get("display_name"), url=data["external_urls"]["spotify"])
+
+
+class CurrentlyPlaying(NamedTuple):
+    """What a user's player is doing, without the rest of the response."""
+
+    track: Optional[Track]
+    playing: bool
+    progress_ms: int
+    duration_ms: int
+
+    @classmethod
+    def from_json(cls, data: dict) -> "CurrentlyPlaying":
+        """Pick fields from a currently playing response; episodes and ads have no track."""
+
+        item = data.get("item") or {}
+        return cls(
+            track=Track.from_json(item) if item and item.get("type", "track") == "track" else None,
+            playing=data.get("is_playing", False),
+            progress_ms=data.get("progress_ms") or 0,
+            duration_ms=item.get("duration_ms") or 0)
+
+
+def parse_recently_played(data: dict) -> Tuple[Track, ...]:
+    """Pick tracks from a recently played response, newest first."""
+
+    return tuple(Track.from_json(item["track"]) for item in data["items"] if "track" in item)
@@ -0,0 +1,122 @@
+from django.conf import settings
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .cache import LRUCache
+from .spotify import Track
+
+__all__ = (
+    "TrackCache",
+    "tracks",)
+
+
+class TrackCache:
+    """Track metadata shared by every channel and kept across restarts.
+
+    Lookups check a bounded in-memory LRU first and then an SQLite file
+    separate from the application database, promoting disk hits into
+    memory. Only the compact Track record is stored, along with its
+    ETag so that expired tracks can be revalidated instead of fetched.
+    """
+
+    memory: LRUCache[str, Track]
+
+    def __init__(self, path: str, size: int = 10000, memory_ttl: float = 24 * 60 * 60, disk_ttl: float = 30 * 24 * 60 * 60):
+        """Open lazily so importing never touches the disk."""
+
+        self.path = path
+        self.memory = LRUCache(size=size, ttl=memory_ttl)
+        self.disk_ttl = disk_ttl
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.revalidated = 0
+        self.lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Create the table on first use; call with the lock held."""
+
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS track ("
+                "id TEXT PRIMARY KEY, name TEXT, artists TEXT, url TEXT, time_cached REAL, etag TEXT)")
+
+            # Files written before ETags were kept lack the column
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(track)")}
+            if "etag" not in columns:
+                self._connection.execute("ALTER TABLE track ADD COLUMN etag TEXT")
+        return self._connection
+
+    def get(self, track_id: str) -> Tuple[Optional[Track], Optional[str], bool]:
+        """Check memory, then disk; see load."""
+
+        track = self.memory.get(track_id)
+        if track is not None:
+            return track, None, True
+
+        return self.load(track_id)
+
+    def load(self, track_id: str) -> Tuple[Optional[Track], Optional[str], bool]:
+        """Check disk only, promoting a hit to memory.
+
+        Returns the track, its ETag and whether it's still fresh. An
+        expired track is only returned if it has an ETag to revalidate.
+        """
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT name, artists, url, etag, time_cached FROM track WHERE id = ?",
+                (track_id,)).fetchone()
+
+            fresh = row is not None and row[4] > time.time() - self.disk_ttl
+            if fresh:
+                self.disk_hits += 1
+            else:
+                self.disk_misses += 1
+
+        if row is None or not fresh and row[3] is None:
+            return None, None, False
+
+        name, artists, url, etag, _ = row
+        track = Track(id=track_id, name=name, artists=tuple(json.loads(artists)), url=url)
+        if fresh:
+            self.memory.put(track_id, track)
+        return track, etag, fresh
+
+    def put(self, track: Track, etag: Optional[str] = None, revalidated: bool = False):
+        """Store in both tiers."""
+
+        self.memory.put(track.id, track)
+        self.store(track, etag, revalidated)
+
+    def store(self, track: Track, etag: Optional[str] = None, revalidated: bool = False):
+        """Store on disk only, renewing the entry if it was revalidated."""
+
+        with self.lock:
+            if revalidated:
+                self.revalidated += 1
+            self.connection.execute(
+                "INSERT OR REPLACE INTO track (id, name, artists, url, time_cached, etag) VALUES (?, ?, ?, ?, ?, ?)",
+                (track.id, track.name, json.dumps(track.artists), track.url, time.time(), etag))
+
+    def stats(self) -> Dict[str, int]:
+        """Hits and misses per tier."""
+
+        memory = self.memory.stats()
+        return {
+            "memory_size": memory["size"],
+            "memory_hits": memory["hits"],
+            "memory_misses": memory["misses"],
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+            "revalidated": self.revalidated}
+
+
+tracks = TrackCache(str(settings.TRACK_CACHE_PATH))
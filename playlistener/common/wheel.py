@@ -0,0 +1,106 @@
+import math
+from typing import Dict, Generic, Hashable, List, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+
+class TimingWheel(Generic[K]):
+    """Hierarchical timing wheel for many keyed expiries.
+
+    Time is cut into ticks of resolution seconds. The first level has
+    one slot per tick, and each level above has slots covering a whole
+    turn of the level below; entries in a higher slot are cascaded down
+    when the wheel reaches it. Scheduling and cancelling are O(1) and
+    advancing costs one slot per tick passed plus the entries that move.
+    Expiries further out than the top level can reach wait in its last
+    slot and are cascaded again. Not thread-safe.
+    """
+
+    resolution: float
+    size: int
+    tick: int
+    levels: List[List[Dict[K, int]]]
+    where: Dict[K, Tuple[int, int]]
+
+    def __init__(self, resolution: float, now: float, size: int = 64, depth: int = 4):
+        """Start the wheel at now, in seconds from the caller's clock."""
+
+        self.resolution = resolution
+        self.size = size
+        self.tick = math.floor(now / resolution)
+        self.levels = [[{} for _ in range(size)] for _ in range(depth)]
+        self.where = {}
+
+    def __len__(self) -> int:
+        """Count scheduled keys."""
+
+        return len(self.where)
+
+    def __contains__(self, key: K) -> bool:
+        """Check whether a key is scheduled."""
+
+        return key in self.where
+
+    def place(self, key: K, due: int, earliest: int):
+        """Put a key in the lowest level whose span reaches its tick."""
+
+        due_slot = max(due, earliest)
+        delta = due_slot - self.tick
+        for level in range(len(self.levels)):
+            span = self.size ** level
+            top = level == len(self.levels) - 1
+            if delta < span * self.size or top:
+                if delta >= span * self.size:
+                    slot = (self.tick // span) % self.size
+                else:
+                    slot = (due_slot // span) % self.size
+                self.levels[level][slot][key] = due
+                self.where[key] = (level, slot)
+                return
+
+    def schedule(self, key: K, when: float):
+        """Expire a key at when, replacing any earlier schedule."""
+
+        self.cancel(key)
+        self.place(key, math.ceil(when / self.resolution), self.tick + 1)
+
+    def cancel(self, key: K) -> bool:
+        """Unschedule a key, returning whether it was scheduled."""
+
+        where = self.where.pop(key, None)
+        if where is None:
+            return False
+
+        level, slot = where
+        del self.levels[level][slot][key]
+        return True
+
+    def advance(self, now: float) -> List[K]:
+        """Move the wheel up to now and return the keys that expired."""
+
+        target = math.floor(now / self.resolution)
+        expired = []
+        while self.tick < target:
+            self.tick += 1
+
+            # Cascade from the top so entries can fall several levels at once
+            for level in range(len(self.levels) - 1, 0, -1):
+                span = self.size ** level
+                if self.tick % span == 0:
+                    slot = (self.tick // span) % self.size
+                    entries = self.levels[level][slot]
+                    self.levels[level][slot] = {}
+                    for key, due in entries.items():
+                        self.place(key, due, self.tick)
+
+            slot = self.tick % self.size
+            entries = self.levels[0][slot]
+            self.levels[0][slot] = {}
+            for key, due in entries.items():
+                if due <= self.tick:
+                    del self.where[key]
+                    expired.append(key)
+                else:
+                    self.place(key, due, self.tick + 1)
+
+        return expired
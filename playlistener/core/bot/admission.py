@@ -0,0 +1,169 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from typing import Coroutine, Dict, List, Optional, Tuple
+
+__all__ = (
+    "PRIORITY_BROADCASTER",
+    "PRIORITY_MODERATOR",
+    "PRIORITY_SUBSCRIBER",
+    "PRIORITY_VIEWER",
+    "Ticket",
+    "AdmissionController",)
+
+PRIORITY_BROADCASTER = 0
+PRIORITY_MODERATOR = 1
+PRIORITY_SUBSCRIBER = 2
+PRIORITY_VIEWER = 3
+
+
+class Ticket:
+    """An admitted request waiting for or holding a slot."""
+
+    __slots__ = ("channel", "priority", "sequence", "future")
+
+    def __init__(self, channel: str, priority: int, sequence: int):
+        """The future is created once the ticket waits on the loop."""
+
+        self.channel = channel
+        self.priority = priority
+        self.sequence = sequence
+        self.future: Optional[asyncio.Future] = None
+
+
+class ChannelState:
+    """Slots, waiters and service time for one channel."""
+
+    __slots__ = ("admitted", "active", "waiting", "service")
+
+    def __init__(self, service: float):
+        """Start idle."""
+
+        self.admitted: List[int] = [0, 0, 0, 0]
+        self.active = 0
+        self.waiting: List[Tuple[int, int, Ticket]] = []
+        self.service = service
+
+
+class AdmissionController:
+    """Bounds and orders the Spotify work of each channel's commands.
+
+    A channel runs at most concurrency requests at once; the rest wait
+    in priority order, broadcaster first and viewers last. Requests are
+    turned away up front when the channel's backlog is full or the wait
+    estimated from recent service times is too long, except for the
+    broadcaster's own. Admission may be decided on any thread, waiting
+    and running happen on the event loop.
+    """
+
+    def __init__(self, concurrency: int = 8, smoothing: float = 0.2, service: float = 1.0):
+        """Leave enough slots per channel for playlist adds to batch."""
+
+        self.concurrency = concurrency
+        self.smoothing = smoothing
+        self.initial_service = service
+        self.channels: Dict[str, ChannelState] = {}
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+
+        self.accepted = 0
+        self.rejected = 0
+        self.waits = 0
+        self.wait_total = 0.0
+
+    def estimate(self, state: ChannelState, priority: int) -> float:
+        """Seconds a new request of this priority would wait."""
+
+        ahead = sum(state.admitted[:priority + 1])
+        return ahead // self.concurrency * state.service
+
+    def admit(self, channel: str, priority: int, backlog_max: int, wait_max: float) -> Optional[Ticket]:
+        """Get a ticket, or None if the request should be turned away."""
+
+        with self.lock:
+            state = self.channels.get(channel)
+            if state is None:
+                state = self.channels[channel] = ChannelState(self.initial_service)
+
+            if priority > PRIORITY_BROADCASTER:
+                if sum(state.admitted) >= backlog_max or self.estimate(state, priority) > wait_max:
+                    self.rejected += 1
+                    return None
+
+            state.admitted[priority] += 1
+            self.accepted += 1
+            return Ticket(channel, priority, next(self.sequence))
+
+    async def acquire(self, ticket: Ticket):
+        """Wait for a slot in the ticket's channel."""
+
+        with self.lock:
+            state = self.channels[ticket.channel]
+            if state.active < self.concurrency and not state.waiting:
+                state.active += 1
+                return
+
+            ticket.future = asyncio.get_running_loop().create_future()
+            heapq.heappush(state.waiting, (ticket.priority, ticket.sequence, ticket))
+
+        started = time.monotonic()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # The slot was handed over just before, pass it on
+                self.release(ticket, state.service)
+                raise
+
+            with self.lock:
+                state.waiting.remove((ticket.priority, ticket.sequence, ticket))
+                heapq.heapify(state.waiting)
+                state.admitted[ticket.priority] -= 1
+            raise
+
+        self.waits += 1
+        self.wait_total += time.monotonic() - started
+
+    def release(self, ticket: Ticket, elapsed: float):
+        """Free a slot, hand it to the next waiter and learn the service time."""
+
+        with self.lock:
+            state = self.channels[ticket.channel]
+            state.admitted[ticket.priority] -= 1
+            state.service += self.smoothing * (elapsed - state.service)
+
+            while state.waiting:
+                _, _, waiter = heapq.heappop(state.waiting)
+                if not waiter.future.done():
+                    waiter.future.set_result(None)
+                    return
+
+            state.active -= 1
+
+    async def run(self, ticket: Ticket, coroutine: Coroutine):
+        """Await a coroutine once the ticket gets a slot."""
+
+        try:
+            await self.acquire(ticket)
+        except asyncio.CancelledError:
+            coroutine.close()
+            raise
+
+        started = time.monotonic()
+        try:
+            await coroutine
+        finally:
+            self.release(ticket, time.monotonic() - started)
+
+    def stats(self) -> Dict[str, float]:
+        """Admission counts and waits for reporting."""
+
+        with self.lock:
+            backlog = sum(sum(state.admitted) for state in self.channels.values())
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "backlog": backlog,
+            "wait_average": self.wait_total / self.waits if self.waits else 0.0}
@@ -0,0 +1,284 @@
+from django.conf import settings
+from aiohttp import web
+
+import hashlib
+import hmac
+import httpx
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from common.cache import LRUCache
+from common.http import get_async_client, get_timeout
+from common.errors import InternalError, UnavailableError
+
+__all__ = (
+    "STREAM_ONLINE",
+    "STREAM_OFFLINE",
+    "sign",
+    "EventSubReceiver",)
+
+logger = logging.getLogger(__name__)
+
+TWITCH_TOKEN_URL = "https://id.twitch.tv/oauth2/token"
+TWITCH_SUBSCRIPTIONS_URL = "https://api.twitch.tv/helix/eventsub/subscriptions"
+
+STREAM_ONLINE = "stream.online"
+STREAM_OFFLINE = "stream.offline"
+
+# Twitch retries for up to ten minutes; anything older is a replay
+MESSAGE_MAX_AGE = timedelta(minutes=10)
+
+StreamCallback = Callable[[str], Awaitable[None]]
+
+
+def sign(secret: str, message_id: str, timestamp: str, body: bytes) -> str:
+    """Compute the Twitch-Eventsub-Message-Signature header value."""
+
+    message = message_id.encode() + timestamp.encode() + body
+    return "sha256=" + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """Parse Twitch's RFC 3339 timestamps, which carry nanoseconds."""
+
+    timestamp = timestamp.rstrip("Z")
+    if "." in timestamp:
+        whole, fraction = timestamp.split(".", 1)
+        timestamp = f"{whole}.{fraction[:6]}"
+    return datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc)
+
+
+class EventSubReceiver:
+    """Webhook receiver and subscription manager for stream events.
+
+    Every notification is checked against the shared secret and its
+    timestamp, and duplicate deliveries are dropped by message ID
+    before the online or offline callback is invoked with the
+    broadcaster's login. Subscriptions are created and removed so that
+    they match the channels passed to reconcile.
+    """
+
+    secret: str
+    callback_url: str
+    subscriptions: Dict[Tuple[str, str], str]
+
+    def __init__(self, secret: str, callback_url: str, on_online: StreamCallback, on_offline: StreamCallback):
+        """Set up the route, nothing is served until start."""
+
+        self.secret = secret
+        self.callback_url = callback_url
+        self.on_online = on_online
+        self.on_offline = on_offline
+
+        self.app = web.Application()
+        self.app.router.add_post(urlsplit(callback_url).path or "/", self.receive)
+        self.runner: Optional[web.AppRunner] = None
+
+        self.seen: LRUCache[str, bool] = LRUCache(size=10000, ttl=MESSAGE_MAX_AGE.total_seconds())
+        self.subscriptions = {}
+        self.app_token: Optional[str] = None
+        self.app_token_expires = 0.0
+
+        self.received = 0
+        self.duplicates = 0
+        self.rejected = 0
+
+    async def start(self, host: str, port: int):
+        """Start serving webhooks."""
+
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        logger.info("receiving EventSub notifications on %s:%d for %s", host, port, self.callback_url)
+
+    async def stop(self):
+        """Stop serving webhooks."""
+
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def receive(self, request: web.Request) -> web.Response:
+        """Verify a delivery and dispatch it."""
+
+        body = await request.read()
+        try:
+            message_id = request.headers["Twitch-Eventsub-Message-Id"]
+            message_type = request.headers["Twitch-Eventsub-Message-Type"]
+            timestamp = request.headers["Twitch-Eventsub-Message-Timestamp"]
+            signature = request.headers["Twitch-Eventsub-Message-Signature"]
+        except KeyError:
+            self.rejected += 1
+            return web.Response(status=400)
+
+        if not hmac.compare_digest(sign(self.secret, message_id, timestamp, body), signature):
+            logger.warning("discarding EventSub message %s with a bad signature", message_id)
+            self.rejected += 1
+            return web.Response(status=403)
+
+        try:
+            age = datetime.now(timezone.utc) - parse_timestamp(timestamp)
+            payload = json.loads(body)
+        except ValueError:
+            self.rejected += 1
+            return web.Response(status=400)
+
+        if age > MESSAGE_MAX_AGE:
+            logger.warning("discarding EventSub message %s from %s ago", message_id, age)
+            self.rejected += 1
+            return web.Response(status=403)
+
+        if self.seen.get(message_id) is not None:
+            self.duplicates += 1
+            return web.Response(status=204)
+        self.seen.put(message_id, True)
+        self.received += 1
+
+        subscription = payload.get("subscription", {})
+        if message_type == "webhook_callback_verification":
+            logger.info("verified %s subscription %s", subscription.get("type"), subscription.get("id"))
+            return web.Response(status=200, text=payload["challenge"], content_type="text/plain")
+
+        if message_type == "revocation":
+            logger.warning(
+                "%s subscription for %s revoked: %s",
+                subscription.get("type"),
+                subscription.get("condition", {}).get("broadcaster_user_id"),
+                subscription.get("status"))
+            self.subscriptions.pop((subscription.get("type"), subscription.get("condition", {}).get("broadcaster_user_id")), None)
+            return web.Response(status=204)
+
+        if message_type == "notification":
+            event = payload.get("event", {})
+            login = event.get("broadcaster_user_login")
+            if subscription.get("type") == STREAM_ONLINE and login:
+                await self.on_online(login)
+            elif subscription.get("type") == STREAM_OFFLINE and login:
+                await self.on_offline(login)
+            return web.Response(status=204)
+
+        return web.Response(status=400)
+
+    async def get_app_token(self) -> str:
+        """Get an app access token, which EventSub webhooks require."""
+
+        if self.app_token is not None and time.monotonic() < self.app_token_expires:
+            return self.app_token
+
+        try:
+            response = await get_async_client().post(TWITCH_TOKEN_URL, data={
+                "client_id": settings.TWITCH_CLIENT_ID,
+                "client_secret": settings.TWITCH_CLIENT_SECRET,
+                "grant_type": "client_credentials"}, timeout=get_timeout())
+        except httpx.TransportError as error:
+            raise UnavailableError("failed to reach Twitch", details=repr(error))
+
+        if response.status_code != 200:
+            logger.error("failed to get Twitch app token, received status %d: %s", response.status_code, response.text)
+            raise InternalError("failed to authorize with Twitch")
+
+        data = response.json()
+        self.app_token = data["access_token"]
+        self.app_token_expires = time.monotonic() + data["expires_in"] - 60
+        return self.app_token
+
+    async def helix(self, method: str, params: Optional[Dict[str, str]] = None, body: Any = None) -> Any:
+        """Call the subscriptions endpoint, renewing the token once."""
+
+        for _ in range(2):
+            headers = {"Client-Id": settings.TWITCH_CLIENT_ID, "Authorization": f"Bearer {await self.get_app_token()}"}
+            try:
+                response = await get_async_client().request(
+                    method,
+                    TWITCH_SUBSCRIPTIONS_URL,
+                    params=params,
+                    json=body,
+                    headers=headers,
+                    timeout=get_timeout())
+            except httpx.TransportError as error:
+                raise UnavailableError("failed to reach Twitch", details=repr(error))
+
+            if response.status_code == 401:
+                self.app_token = None
+                continue
+            return response
+
+        return response
+
+    async def list_subscriptions(self) -> Dict[Tuple[str, str], str]:
+        """Get the IDs of our subscriptions by type and broadcaster ID."""
+
+        subscriptions = {}
+        params = {}
+        while True:
+            response = await self.helix("GET", params=params)
+            if response.status_code != 200:
+                logger.error("failed to list EventSub subscriptions, received status %d: %s", response.status_code, response.text)
+                raise InternalError("failed to list EventSub subscriptions")
+
+            data = response.json()
+            for subscription in data["data"]:
+                if subscription["transport"].get("callback") != self.callback_url:
+                    continue
+                if subscription["status"] not in ("enabled", "webhook_callback_verification_pending"):
+                    continue
+                key = (subscription["type"], subscription["condition"].get("broadcaster_user_id"))
+                subscriptions[key] = subscription["id"]
+
+            cursor = data.get("pagination", {}).get("cursor")
+            if not cursor:
+                return subscriptions
+            params = {"after": cursor}
+
+    async def subscribe(self, subscription_type: str, twitch_id: str):
+        """Create a subscription, Twitch verifies it with a challenge."""
+
+        response = await self.helix("POST", body={
+            "type": subscription_type,
+            "version": "1",
+            "condition": {"broadcaster_user_id": twitch_id},
+            "transport": {"method": "webhook", "callback": self.callback_url, "secret": self.secret}})
+
+        if response.status_code == 202:
+            self.subscriptions[subscription_type, twitch_id] = response.json()["data"][0]["id"]
+        elif response.status_code != 409:
+            logger.error(
+                "failed to subscribe to %s for %s, received status %d: %s",
+                subscription_type,
+                twitch_id,
+                response.status_code,
+                response.text)
+
+    async def unsubscribe(self, subscription_id: str):
+        """Delete a subscription."""
+
+        response = await self.helix("DELETE", params={"id": subscription_id})
+        if response.status_code not in (204, 404):
+            logger.error("failed to delete subscription %s, received status %d", subscription_id, response.status_code)
+
+    async def reconcile(self, twitch_ids: Iterable[str]):
+        """Subscribe to exactly the given broadcasters' stream events."""
+
+        self.subscriptions = await self.list_subscriptions()
+        wanted: Set[Tuple[str, str]] = {
+            (subscription_type, twitch_id)
+            for twitch_id in twitch_ids
+            for subscription_type in (STREAM_ONLINE, STREAM_OFFLINE)}
+
+        for key in wanted - self.subscriptions.keys():
+            await self.subscribe(*key)
+        for key in self.subscriptions.keys() - wanted:
+            await self.unsubscribe(self.subscriptions.pop(key))
+
+    def stats(self) -> Dict[str, int]:
+        """Delivery counters for reporting."""
+
+        return {
+            "subscriptions": len(self.subscriptions),
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected}
@@ -0,0 +1,262 @@
+from django.db.models import Count, Max, Q, QuerySet, Sum
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.models import SpotifyAuthorization, TwitchIntegration
+from common.errors import UsageError
+
+__all__ = (
+    "IntegrationSnapshot",
+    "IntegrationCache",
+    "integrations",)
+
+# Columns copied into snapshots and the attribute each is stored as
+SNAPSHOT_COLUMNS = (
+    "id",
+    "user_id",
+    "twitch_id",
+    "twitch_login",
+    "enabled",
+    "queue_cooldown",
+    "queue_cooldown_subscriber",
+    "queue_backlog",
+    "queue_wait",
+    "subscribers_only",
+    "add_to_queue",
+    "add_to_playlist",
+    "playlist_id",
+    "user__first_name",
+    "time_modified",)
+SNAPSHOT_FIELDS = tuple(column.replace("user__", "") for column in SNAPSHOT_COLUMNS)
+
+# Rows committed late can carry a modification time before the last sync
+SYNC_OVERLAP = timedelta(minutes=1)
+RELOAD_CHUNK = 500
+
+
+class IntegrationSnapshot:
+    """The parts of a Twitch integration the bot reads per command.
+
+    Snapshots are never saved; commands that change an integration
+    load the model and the save invalidates the snapshot. The Spotify
+    authorization is kept as a model since it owns the API methods.
+    """
+
+    __slots__ = SNAPSHOT_FIELDS + ("spotify",)
+
+    def __init__(self, row: Tuple, spotify: Optional[SpotifyAuthorization]):
+        """Copy from a row of SNAPSHOT_COLUMNS."""
+
+        for field, value in zip(SNAPSHOT_FIELDS, row):
+            setattr(self, field, value)
+        self.spotify = spotify
+
+    def get_spotify(self) -> SpotifyAuthorization:
+        """Get the authorization or explain why there isn't one."""
+
+        if self.spotify is None:
+            raise UsageError(f"{self.first_name} hasn't connected Spotify to playlistener!")
+        return self.spotify
+
+    def __repr__(self) -> str:
+        """Identify by channel."""
+
+        return f"<IntegrationSnapshot {self.twitch_login}>"
+
+
+def load_snapshots(queryset: QuerySet) -> List[IntegrationSnapshot]:
+    """Query just the columns snapshots need and their authorizations."""
+
+    rows = list(queryset.values_list(*SNAPSHOT_COLUMNS))
+    if not rows:
+        return []
+
+    authorizations = {
+        authorization.user_id: authorization
+        for authorization in SpotifyAuthorization.objects.select_related("user").filter(
+            user__twitch_integration__in=queryset.values("id"))}
+    return [IntegrationSnapshot(row, authorizations.get(row[SNAPSHOT_FIELDS.index("user_id")])) for row in rows]
+
+
+class IntegrationCache:
+    """Process-wide snapshots keyed by Twitch login.
+
+    Saves made in this process drop the affected snapshots through
+    model signals. Changes made elsewhere, e.g. by the web views, are
+    picked up by the bot's periodic sync, which only reloads what
+    changed since the last one.
+    """
+
+    snapshots: Dict[str, IntegrationSnapshot]
+    by_id: Dict[int, IntegrationSnapshot]
+    time_synced: Optional[datetime]
+
+    def __init__(self):
+        """Start empty."""
+
+        self.snapshots = {}
+        self.by_id = {}
+        self.time_synced = None
+        self.lock = threading.Lock()
+        self.reloaded = 0
+
+    def fill(self) -> Dict[str, IntegrationSnapshot]:
+        """Replace every snapshot from the database."""
+
+        time_synced = self.get_time_modified()
+        snapshots = load_snapshots(TwitchIntegration.objects.all())
+        with self.lock:
+            self.snapshots = {snapshot.twitch_login: snapshot for snapshot in snapshots}
+            self.by_id = {snapshot.id: snapshot for snapshot in snapshots}
+            self.time_synced = time_synced
+            self.reloaded += len(snapshots)
+            return dict(self.snapshots)
+
+    def sync(self) -> Dict[str, IntegrationSnapshot]:
+        """Apply changes made since the last sync or fill.
+
+        Integrations modified since then, or whose user's Spotify
+        authorization was, are reloaded. Deletions leave no modification
+        time, so counts and sums of IDs are compared with the snapshots
+        and IDs are only listed when those differ.
+        """
+
+        if self.time_synced is None:
+            return self.fill()
+
+        remote = TwitchIntegration.objects.aggregate(
+            count=Count("id"),
+            total=Sum("id"),
+            spotify_count=Count("user__spotify"),
+            spotify_total=Sum("user__spotify__id"),
+            modified=Max("time_modified"),
+            spotify_modified=Max("user__spotify__time_modified"))
+
+        since = self.time_synced - SYNC_OVERLAP
+        self.update(load_snapshots(TwitchIntegration.objects.filter(
+            Q(time_modified__gte=since) | Q(user__spotify__time_modified__gte=since))))
+
+        expected = (remote["count"], remote["total"] or 0, remote["spotify_count"], remote["spotify_total"] or 0)
+        if self.checksum() != expected:
+            self.reconcile()
+
+        with self.lock:
+            self.time_synced = max(
+                (time for time in (remote["modified"], remote["spotify_modified"], self.time_synced) if time is not None),
+                default=None)
+            return dict(self.snapshots)
+
+    def checksum(self) -> Tuple[int, int, int, int]:
+        """Count and sum snapshot and authorization IDs."""
+
+        with self.lock:
+            spotify_ids = [snapshot.spotify.id for snapshot in self.by_id.values() if snapshot.spotify is not None]
+            return len(self.by_id), sum(self.by_id), len(spotify_ids), sum(spotify_ids)
+
+    def reconcile(self):
+        """Compare IDs with the database to drop and reload snapshots."""
+
+        remote = dict(TwitchIntegration.objects.values_list("id", "user__spotify__id"))
+        with self.lock:
+            for snapshot in [snapshot for snapshot in self.by_id.values() if snapshot.id not in remote]:
+                self.remove(snapshot)
+            stale = [
+                integration_id
+                for integration_id, spotify_id in remote.items()
+                if integration_id not in self.by_id
+                or (self.by_id[integration_id].spotify.id if self.by_id[integration_id].spotify else None) != spotify_id]
+
+        for i in range(0, len(stale), RELOAD_CHUNK):
+            self.update(load_snapshots(TwitchIntegration.objects.filter(id__in=stale[i:i + RELOAD_CHUNK])))
+
+    def update(self, snapshots: Iterable[IntegrationSnapshot]):
+        """Store reloaded snapshots, following changed logins."""
+
+        with self.lock:
+            for snapshot in snapshots:
+                previous = self.by_id.get(snapshot.id)
+                if previous is not None:
+                    self.remove(previous)
+                self.snapshots[snapshot.twitch_login] = snapshot
+                self.by_id[snapshot.id] = snapshot
+                self.reloaded += 1
+
+    def remove(self, snapshot: IntegrationSnapshot):
+        """Drop a snapshot, the lock must be held."""
+
+        if self.snapshots.get(snapshot.twitch_login) is snapshot:
+            del self.snapshots[snapshot.twitch_login]
+        if self.by_id.get(snapshot.id) is snapshot:
+            del self.by_id[snapshot.id]
+
+    def get_time_modified(self) -> Optional[datetime]:
+        """Get the latest modification a full load will include."""
+
+        remote = TwitchIntegration.objects.aggregate(
+            modified=Max("time_modified"),
+            spotify_modified=Max("user__spotify__time_modified"))
+        return max((time for time in remote.values() if time is not None), default=None)
+
+    def get(self, twitch_login: str) -> Optional[IntegrationSnapshot]:
+        """Get a snapshot, only querying if it isn't cached."""
+
+        snapshot = self.snapshots.get(twitch_login)
+        if snapshot is not None:
+            return snapshot
+
+        snapshots = load_snapshots(TwitchIntegration.objects.filter(twitch_login=twitch_login))
+        if not snapshots:
+            return None
+
+        self.update(snapshots)
+        return snapshots[0]
+
+    def logins(self) -> List[str]:
+        """Get the logins of all cached integrations."""
+
+        return list(self.snapshots.keys())
+
+    def invalidate(self, twitch_login: str):
+        """Drop a snapshot so the next access reloads it."""
+
+        with self.lock:
+            snapshot = self.snapshots.get(twitch_login)
+            if snapshot is not None:
+                self.remove(snapshot)
+
+    def invalidate_user(self, user_id: int):
+        """Drop snapshots belonging to a user."""
+
+        with self.lock:
+            for snapshot in list(self.by_id.values()):
+                if snapshot.user_id == user_id:
+                    self.remove(snapshot)
+
+    def stats(self) -> Dict[str, int]:
+        """Snapshots held and reloaded for reporting."""
+
+        return {"snapshots": len(self.by_id), "reloaded": self.reloaded}
+
+
+integrations = IntegrationCache()
+
+
+@receiver(post_save, sender=TwitchIntegration, dispatch_uid="bot_integration_saved")
+@receiver(post_delete, sender=TwitchIntegration, dispatch_uid="bot_integration_deleted")
+def invalidate_integration(instance: TwitchIntegration, **kwargs):
+    """Drop by user as well in case the login was changed."""
+
+    integrations.invalidate(instance.twitch_login)
+    integrations.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=SpotifyAuthorization, dispatch_uid="bot_spotify_saved")
+@receiver(post_delete, sender=SpotifyAuthorization, dispatch_uid="bot_spotify_deleted")
+def invalidate_spotify(instance: SpotifyAuthorization, **kwargs):
+    """Snapshots hold the authorization, so reload them."""
+
+    integrations.invalidate_user(instance.user_id)
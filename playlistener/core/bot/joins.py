@@ -0,0 +1,181 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from common.limits import TokenBucket
+
+__all__ = (
+    "JoinScheduler",)
+
+logger = logging.getLogger(__name__)
+
+
+class Join:
+    """A channel waiting to be joined."""
+
+    __slots__ = ("login", "priority", "time_queued", "attempts")
+
+    def __init__(self, login: str, priority: Tuple[int, float]):
+        """Remember when it was first asked for."""
+
+        self.login = login
+        self.priority = priority
+        self.time_queued = time.monotonic()
+        self.attempts = 0
+
+
+class JoinScheduler:
+    """Joins channels no faster than Twitch allows.
+
+    Channels wait in a priority queue, biggest streams first and then
+    those live the longest, and are joined one at a time as a token
+    bucket allows. Twitch only confirms or times out a join later, so
+    the bot reports back through joined and failed; failures are
+    retried with exponential backoff up to attempts times.
+    """
+
+    def __init__(
+            self,
+            join: Callable[[List[str]], Awaitable[None]],
+            rate: float = 2,
+            capacity: float = 20,
+            attempts: int = 5,
+            backoff: float = 15,
+            backoff_max: float = 300):
+        """Default to Twitch's limit of 20 joins per 10 seconds."""
+
+        self.join = join
+        self.bucket = TokenBucket(rate, capacity)
+        self.attempts = attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+        self.queue: List[Tuple[Tuple[int, float], int, Join]] = []
+        self.counter = itertools.count()
+        self.pending: Dict[str, Join] = {}
+        self.sent: Dict[str, Join] = {}
+        self.retrying: Dict[str, asyncio.TimerHandle] = {}
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+        self.joins = 0
+        self.failures = 0
+        self.abandoned = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        """Start joining in the background."""
+
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        """Stop joining and drop pending retries."""
+
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for handle in self.retrying.values():
+            handle.cancel()
+        self.retrying.clear()
+
+    def add(self, login: str, viewers: int = 0, started_at: Optional[datetime] = None):
+        """Queue a channel unless it's already on its way."""
+
+        if login in self.pending or login in self.sent or login in self.retrying:
+            return
+
+        priority = (-viewers, started_at.timestamp() if started_at is not None else time.time())
+        self.push(Join(login, priority))
+
+    def push(self, join: Join):
+        """Put a join on the queue and wake the worker."""
+
+        self.retrying.pop(join.login, None)
+        self.pending[join.login] = join
+        heapq.heappush(self.queue, (join.priority, next(self.counter), join))
+        self.ready.set()
+
+    def discard(self, login: str):
+        """Forget a channel, e.g. because its stream ended."""
+
+        self.pending.pop(login, None)
+        self.sent.pop(login, None)
+        handle = self.retrying.pop(login, None)
+        if handle is not None:
+            handle.cancel()
+
+    def joined(self, login: str):
+        """Record a confirmed join."""
+
+        join = self.sent.pop(login, None)
+        if join is None:
+            return
+
+        latency = time.monotonic() - join.time_queued
+        self.joins += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def failed(self, login: str) -> bool:
+        """Schedule a retry, returning False if there won't be one."""
+
+        join = self.sent.pop(login, None)
+        if join is None:
+            return False
+
+        self.failures += 1
+        if join.attempts >= self.attempts:
+            logger.error("giving up on joining %s after %d attempts", login, join.attempts)
+            self.abandoned += 1
+            return False
+
+        delay = min(self.backoff * 2 ** (join.attempts - 1), self.backoff_max)
+        logger.warning("failed to join %s, retrying in %ds", login, delay)
+        self.retrying[login] = asyncio.get_running_loop().call_later(delay, self.push, join)
+        return True
+
+    async def run(self):
+        """Join the highest priority channel whenever a token is free."""
+
+        while True:
+            await self.ready.wait()
+
+            delay = self.bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            join = None
+            while self.queue and join is None:
+                _, _, candidate = heapq.heappop(self.queue)
+                if self.pending.get(candidate.login) is candidate:
+                    join = self.pending.pop(candidate.login)
+            if not self.queue:
+                self.ready.clear()
+            if join is None:
+                continue
+
+            join.attempts += 1
+            self.sent[join.login] = join
+            try:
+                await self.join([join.login])
+            except Exception as error:
+                logger.error("failed to send join for %s", join.login, exc_info=error)
+                self.sent.pop(join.login, None)
+                self.push(join)
+
+    def stats(self) -> Dict[str, float]:
+        """Backlog and latency for reporting."""
+
+        return {
+            "backlog": len(self.pending) + len(self.retrying),
+            "unconfirmed": len(self.sent),
+            "joins": self.joins,
+            "failures": self.failures,
+            "abandoned": self.abandoned,
+            "latency_average": self.latency_total / self.joins if self.joins else 0.0,
+            "latency_max": self.latency_max}
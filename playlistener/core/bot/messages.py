@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from twitchio import Channel
+from twitchio.ext.commands import Context
+
+from common.limits import RequestScheduler
+
+__all__ = (
+    "MessagePipeline",
+    "PipelineContext",)
+
+logger = logging.getLogger(__name__)
+
+# Twitch rejects longer messages
+MESSAGE_LIMIT = 500
+SEPARATOR = " | "
+
+
+class Outgoing:
+    """A message waiting to be sent."""
+
+    __slots__ = ("channel", "context", "text", "merge", "time_queued")
+
+    def __init__(self, channel: Channel, context: Optional[Context], text: str, merge: bool):
+        """Replies keep their context, plain messages only the channel."""
+
+        self.channel = channel
+        self.context = context
+        self.text = text
+        self.merge = merge
+        self.time_queued = time.monotonic()
+
+    def mention(self) -> str:
+        """Text that still says who it's for once merged."""
+
+        return f"@{self.context.author.name} {self.text}" if self.context is not None else self.text
+
+
+class MessagePipeline:
+    """Sends chat messages within Twitch's rate limits.
+
+    Messages wait in a bounded queue per channel and are sent in order
+    as both the account-wide and the channel's token bucket allow;
+    anything beyond the bounds is dropped. Replies marked mergeable
+    wait window seconds and are then sent together with any other
+    mergeable replies queued in the channel, as one message that
+    mentions each author.
+    """
+
+    def __init__(
+            self,
+            rate: float = 20 / 30,
+            capacity: float = 20,
+            channel_rate: float = 1,
+            channel_capacity: float = 1,
+            size: int = 1000,
+            channel_size: int = 20,
+            window: float = 0.5):
+        """Default to the limits for an account that isn't a moderator."""
+
+        self.limits = RequestScheduler(rate, capacity, channel_rate, channel_capacity)
+        self.size = size
+        self.channel_size = channel_size
+        self.window = window
+
+        self.queues: Dict[str, Deque[Outgoing]] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.draining: Dict[str, asyncio.Task] = {}
+        self.queued = 0
+
+        self.sent = 0
+        self.merged = 0
+        self.dropped = 0
+        self.failed = 0
+
+    async def send(self, channel: Channel, text: str):
+        """Queue a message to a channel."""
+
+        self.put(Outgoing(channel, None, text, False))
+
+    async def reply(self, context: Context, text: str, merge: bool = False):
+        """Queue a reply to whoever invoked a command."""
+
+        self.put(Outgoing(context.channel, context, text, merge))
+
+    def put(self, message: Outgoing):
+        """Queue a message, dropping it if the queue is full."""
+
+        name = message.channel.name
+        queue = self.queues.get(name)
+        if self.queued >= self.size or queue is not None and len(queue) >= self.channel_size:
+            logger.warning("dropping message to %s, queue is full", name)
+            self.dropped += 1
+            return
+
+        if queue is None:
+            queue = self.queues[name] = deque()
+        queue.append(message)
+        self.queued += 1
+        if name not in self.draining:
+            task = self.draining[name] = asyncio.ensure_future(self.drain(name))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def take(self, queue: Deque[Outgoing]) -> List[Outgoing]:
+        """Pop the next message and any replies that merge with it."""
+
+        first = queue.popleft()
+        if not first.merge:
+            return [first]
+
+        batch = [first]
+        length = len(first.mention())
+        kept = deque()
+        while queue:
+            message = queue.popleft()
+            if message.merge and length + len(SEPARATOR) + len(message.mention()) <= MESSAGE_LIMIT:
+                batch.append(message)
+                length += len(SEPARATOR) + len(message.mention())
+            else:
+                kept.append(message)
+        queue.extend(kept)
+        return batch
+
+    async def drain(self, name: str):
+        """Send a channel's messages until its queue is empty."""
+
+        queue = self.queues[name]
+        try:
+            while queue:
+                if queue[0].merge:
+                    await asyncio.sleep(max(0.0, queue[0].time_queued + self.window - time.monotonic()))
+                await self.limits.await_turn(name)
+
+                batch = self.take(queue)
+                self.queued -= len(batch)
+                await self.deliver(batch)
+        finally:
+            del self.draining[name]
+            if not queue:
+                self.queues.pop(name, None)
+
+    async def deliver(self, batch: List[Outgoing]):
+        """Send one message, merged if the batch holds several."""
+
+        try:
+            if len(batch) > 1:
+                self.merged += len(batch) - 1
+                await batch[0].channel.send(SEPARATOR.join(message.mention() for message in batch))
+            elif batch[0].context is not None:
+                await batch[0].context.reply(batch[0].text)
+            else:
+                await batch[0].channel.send(batch[0].text)
+            self.sent += 1
+        except Exception as error:
+            logger.error("failed to send message to %s", batch[0].channel.name, exc_info=error)
+            self.failed += 1
+
+    async def close(self):
+        """Wait for queued messages to go out."""
+
+        if self.tasks:
+            await asyncio.wait(self.tasks)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and message counts for reporting."""
+
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "waits": self.limits.stats()}
+
+
+class PipelineContext:
+    """Stands in for a command context, sending through a pipeline.
+
+    Everything but reply and send is passed through to the context, so
+    commands use it as they would the original.
+    """
+
+    def __init__(self, context: Context, pipeline: MessagePipeline):
+        """Wrap a context."""
+
+        self.context = context
+        self.pipeline = pipeline
+
+    def __getattr__(self, name: str) -> Any:
+        """Pass through to the real context."""
+
+        return getattr(self.context, name)
+
+    async def reply(self, content: str, merge: bool = False):
+        """Queue a reply, optionally mergeable with others."""
+
+        await self.pipeline.reply(self.context, content, merge)
+
+    async def send(self, content: str):
+        """Queue a message to the context's channel."""
+
+        await self.pipeline.send(self.context.channel, content)
@@ -0,0 +1,210 @@
+from django.db.models import Q
+from django.utils import timezone
+
+import logging
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from core.models import TwitchIntegrationUser
+from core.bot.writes import writes
+from common.wheel import TimingWheel
+
+__all__ = (
+    "ChannelModeration",
+    "ModerationCache",
+    "moderation",)
+
+logger = logging.getLogger(__name__)
+
+Cooldown = Tuple[Optional[int], timezone.datetime, bool]
+
+
+class ChannelModeration:
+    """Bans and active cooldowns of one channel, by user name."""
+
+    __slots__ = ("banned", "cooldowns")
+
+    def __init__(self):
+        """Start with nobody banned or cooling down."""
+
+        self.banned: Set[str] = set()
+        self.cooldowns: Dict[str, Cooldown] = {}
+
+
+class ModerationCache:
+    """Keeps joined channels' bans and cooldowns in memory.
+
+    A channel is loaded when the bot joins it and dropped when it
+    leaves, so queue checks never touch the database. Changes apply in
+    memory immediately and are written through the write buffer unless
+    the user has no row yet, in which case whoever saves it writes them.
+    Cooldowns are forgotten once they expire, which a timing wheel
+    tracks so that expiring thousands of them stays cheap.
+    """
+
+    channels: Dict[str, ChannelModeration]
+    wheel: TimingWheel[Tuple[str, str]]
+
+    def __init__(self, resolution: float = 1.0):
+        """Expire cooldowns to within resolution seconds."""
+
+        self.lock = threading.Lock()
+        self.channels = {}
+        self.wheel = TimingWheel(resolution, time.time())
+
+        self.loads = 0
+        self.expired = 0
+
+    def load(self, twitch_login: str) -> ChannelModeration:
+        """Read a channel's bans and live cooldowns, including unwritten ones."""
+
+        now = timezone.now()
+        users = TwitchIntegrationUser.objects.filter(
+            Q(banned=True) | Q(time_cooldown__gt=now) | Q(pk__in=writes.pending_users()),
+            integration__twitch_login=twitch_login,
+        ).only("id", "name", "banned", "time_cooldown", "manual_cooldown", "queue_count")
+
+        channel = ChannelModeration()
+        for user in users:
+            writes.apply(user)
+            if user.banned:
+                channel.banned.add(user.name)
+            if user.time_cooldown is not None and user.time_cooldown > now:
+                channel.cooldowns[user.name] = (user.pk, user.time_cooldown, user.manual_cooldown)
+
+        with self.lock:
+            self.forget(twitch_login)
+            self.channels[twitch_login] = channel
+            for name, (_, time_cooldown, _) in channel.cooldowns.items():
+                self.wheel.schedule((twitch_login, name), time_cooldown.timestamp())
+            self.loads += 1
+
+        logger.debug(
+            "loaded %d bans and %d cooldowns for %s",
+            len(channel.banned),
+            len(channel.cooldowns),
+            twitch_login)
+        return channel
+
+    def forget(self, twitch_login: str):
+        """Remove a channel and its expiries; call with the lock held."""
+
+        channel = self.channels.pop(twitch_login, None)
+        if channel is not None:
+            for name in channel.cooldowns:
+                self.wheel.cancel((twitch_login, name))
+
+    def drop(self, twitch_login: str):
+        """Forget a channel the bot left."""
+
+        with self.lock:
+            self.forget(twitch_login)
+
+    def get(self, twitch_login: str) -> ChannelModeration:
+        """Get a channel's state, loading it if it wasn't joined properly."""
+
+        with self.lock:
+            channel = self.channels.get(twitch_login)
+        if channel is None:
+            channel = self.load(twitch_login)
+        return channel
+
+    def is_banned(self, twitch_login: str, name: str) -> bool:
+        """Check if a user is banned in a channel."""
+
+        channel = self.get(twitch_login)
+        with self.lock:
+            return name in channel.banned
+
+    def get_cooldown(self, twitch_login: str, name: str) -> Optional[Tuple[timezone.datetime, bool]]:
+        """Get a user's cooldown and whether it was set manually, if any is left."""
+
+        channel = self.get(twitch_login)
+        with self.lock:
+            cooldown = channel.cooldowns.get(name)
+        if cooldown is None or cooldown[1] <= timezone.now():
+            return None
+        return cooldown[1], cooldown[2]
+
+    def set_cooldown(
+            self,
+            twitch_login: str,
+            user_id: Optional[int],
+            name: str,
+            time_cooldown: Optional[timezone.datetime],
+            manual_cooldown: bool):
+        """Apply a user's cooldown now and write it later."""
+
+        with self.lock:
+            channel = self.channels.get(twitch_login)
+            if channel is not None:
+                if time_cooldown is None or time_cooldown <= timezone.now():
+                    channel.cooldowns.pop(name, None)
+                    self.wheel.cancel((twitch_login, name))
+                else:
+                    channel.cooldowns[name] = (user_id, time_cooldown, manual_cooldown)
+                    self.wheel.schedule((twitch_login, name), time_cooldown.timestamp())
+
+        if user_id is not None:
+            writes.set_cooldown(user_id, time_cooldown, manual_cooldown)
+
+    def release_cooldown(
+            self,
+            twitch_login: str,
+            user_id: Optional[int],
+            name: str,
+            reserved: timezone.datetime,
+            previous: Optional[timezone.datetime]):
+        """Undo a reserved cooldown unless it has since been replaced."""
+
+        with self.lock:
+            channel = self.channels.get(twitch_login)
+            cooldown = channel.cooldowns.get(name) if channel is not None else None
+            if cooldown is not None and cooldown[1] == reserved:
+                if previous is None or previous <= timezone.now():
+                    del channel.cooldowns[name]
+                    self.wheel.cancel((twitch_login, name))
+                else:
+                    channel.cooldowns[name] = (user_id, previous, cooldown[2])
+                    self.wheel.schedule((twitch_login, name), previous.timestamp())
+
+        if user_id is not None:
+            writes.release_cooldown(user_id, reserved, previous)
+
+    def set_banned(self, twitch_login: str, user_id: int, name: str, banned: bool):
+        """Ban or unban a user now and write it later."""
+
+        with self.lock:
+            channel = self.channels.get(twitch_login)
+            if channel is not None:
+                if banned:
+                    channel.banned.add(name)
+                else:
+                    channel.banned.discard(name)
+
+        writes.set_banned(user_id, banned)
+
+    def expire(self) -> int:
+        """Forget cooldowns that have run out."""
+
+        with self.lock:
+            expired = self.wheel.advance(time.time())
+            for twitch_login, name in expired:
+                self.channels[twitch_login].cooldowns.pop(name, None)
+            self.expired += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        """Counts for reporting."""
+
+        with self.lock:
+            return {
+                "channels": len(self.channels),
+                "banned": sum(len(channel.banned) for channel in self.channels.values()),
+                "cooldowns": len(self.wheel),
+                "loads": self.loads,
+                "expired": self.expired}
+
+
+moderation = ModerationCache()
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from core.bot.integrations import IntegrationSnapshot
+from common.errors import InternalError, UnavailableError, UsageError
+from common.spotify import CurrentlyPlaying, Track
+
+__all__ = (
+    "Playback",
+    "NowPlayingPoller",)
+
+logger = logging.getLogger(__name__)
+
+RECENT = 3
+
+
+class Playback:
+    """What a channel's streamer is listening to, as of the last poll."""
+
+    __slots__ = ("track", "playing", "recent", "time_polled")
+
+    def __init__(self):
+        """Nothing known until the first poll."""
+
+        self.track: Optional[Track] = None
+        self.playing = False
+        self.recent: Deque[Track] = deque(maxlen=RECENT)
+        self.time_polled: Optional[float] = None
+
+    def seed(self, recently_played: Optional[Tuple[Track, ...]]):
+        """Fill recent tracks from Spotify's history, newest first."""
+
+        if recently_played is not None:
+            self.recent.extend(recently_played[:RECENT])
+
+    def update(self, current: Optional[CurrentlyPlaying], now: float):
+        """Record a poll, moving the previous track to recent if it changed."""
+
+        track = current.track if current is not None else None
+        if self.track is not None and track != self.track and (not self.recent or self.recent[0] != self.track):
+            self.recent.appendleft(self.track)
+
+        self.track = track
+        self.playing = current is not None and current.playing
+        self.time_polled = now
+
+
+class NowPlayingPoller:
+    """Follows what joined channels are playing on Spotify.
+
+    Each channel gets a task that polls the currently playing track,
+    timing the next poll for just after the track should end but no
+    later than interval_max, and only every interval_paused seconds
+    while nothing is playing. Commands read the result instead of
+    calling Spotify; a channel whose polls are failing reads as unknown
+    so callers can fall back to asking directly.
+    """
+
+    def __init__(
+            self,
+            lookup: Callable[[str], Optional[IntegrationSnapshot]],
+            interval_min: float = 3,
+            interval_max: float = 30,
+            interval_paused: float = 60,
+            margin: float = 1.5):
+        """Lookup gives the snapshot, and so the Spotify authorization, of a channel."""
+
+        self.lookup = lookup
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self.interval_paused = interval_paused
+        self.margin = margin
+
+        self.channels: Dict[str, Playback] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+        self.polls = 0
+        self.failures = 0
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, twitch_login: str):
+        """Start following a channel."""
+
+        if twitch_login not in self.tasks:
+            self.channels[twitch_login] = Playback()
+            self.tasks[twitch_login] = asyncio.ensure_future(self.run(twitch_login))
+
+    def stop(self, twitch_login: str):
+        """Stop following a channel and forget its playback."""
+
+        task = self.tasks.pop(twitch_login, None)
+        if task is not None:
+            task.cancel()
+        self.channels.pop(twitch_login, None)
+
+    async def close(self):
+        """Stop following every channel."""
+
+        tasks = list(self.tasks.values())
+        for twitch_login in list(self.tasks):
+            self.stop(twitch_login)
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def get(self, twitch_login: str) -> Optional[Playback]:
+        """Get a channel's playback if a recent poll succeeded."""
+
+        playback = self.channels.get(twitch_login)
+        if playback is None or playback.time_polled is None:
+            self.misses += 1
+            return None
+
+        if time.monotonic() - playback.time_polled > self.interval_paused + self.interval_max:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return playback
+
+    def next_delay(self, current: Optional[CurrentlyPlaying]) -> float:
+        """Seconds until the next poll given what's playing."""
+
+        if current is None or not current.playing or not current.duration_ms:
+            return self.interval_paused
+
+        remaining = (current.duration_ms - current.progress_ms) / 1000
+        return min(max(remaining + self.margin, self.interval_min), self.interval_max)
+
+    async def run(self, twitch_login: str):
+        """Poll a channel until stopped."""
+
+        playback = self.channels[twitch_login]
+        seeded = False
+        while True:
+            delay = self.interval_paused
+            snapshot = self.lookup(twitch_login)
+            if snapshot is not None and snapshot.spotify is not None:
+                try:
+                    spotify = snapshot.get_spotify()
+                    if not seeded:
+                        playback.seed(await spotify.aget_recently_played(limit=RECENT))
+                        seeded = True
+
+                    current = await spotify.aget_current_track()
+                    playback.update(current, time.monotonic())
+                    delay = self.next_delay(current)
+                    self.polls += 1
+
+                except (UsageError, UnavailableError, InternalError) as error:
+                    logger.warning("failed to poll playback for %s: %s", twitch_login, error)
+                    self.failures += 1
+                except Exception as error:
+                    logger.error("failed to poll playback for %s", twitch_login, exc_info=error)
+                    self.failures += 1
+
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, int]:
+        """Poll and lookup counts for reporting."""
+
+        return {
+            "channels": len(self.tasks),
+            "polls": self.polls,
+            "failures": self.failures,
+            "hits": self.hits,
+            "misses": self.misses}
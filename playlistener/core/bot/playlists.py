@@ -0,0 +1,123 @@
+import asyncio
+import contextvars
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.models import SpotifyAuthorization
+from common.errors import BotError
+
+__all__ = (
+    "PlaylistBatcher",)
+
+logger = logging.getLogger(__name__)
+
+
+class Batch:
+    """Track URIs waiting to be added to one playlist."""
+
+    __slots__ = ("spotify", "items", "timer")
+
+    def __init__(self, spotify: SpotifyAuthorization):
+        """Start empty, the timer is set by the batcher."""
+
+        self.spotify = spotify
+        self.items: List[Tuple[str, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class PlaylistBatcher:
+    """Coalesces additions to the same playlist into one request.
+
+    The first addition opens a batch that is sent after window seconds
+    or as soon as it holds Spotify's limit of 100 tracks. Batches for a
+    playlist are sent one after another so tracks land in the order
+    they were added. Each caller awaits the outcome of its own batch.
+    """
+
+    LIMIT = 100
+
+    window: float
+    pending: Dict[str, Batch]
+    sending: Dict[str, asyncio.Task]
+
+    def __init__(self, window: float):
+        """Set how long to wait for more tracks."""
+
+        self.window = window
+        self.pending = {}
+        self.sending = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.items = 0
+
+    async def add(self, spotify: SpotifyAuthorization, playlist_id: str, uri: str):
+        """Add a track, raising if its batch failed."""
+
+        loop = asyncio.get_running_loop()
+        batch = self.pending.get(playlist_id)
+        if batch is None:
+            batch = self.pending[playlist_id] = Batch(spotify)
+            batch.timer = loop.call_later(self.window, self.flush, playlist_id)
+
+        future = loop.create_future()
+        batch.items.append((uri, future))
+        if len(batch.items) >= self.LIMIT:
+            self.flush(playlist_id)
+
+        await future
+
+    def flush(self, playlist_id: str):
+        """Send a playlist's pending batch after any batch in flight."""
+
+        batch = self.pending.pop(playlist_id, None)
+        if batch is None:
+            return
+
+        batch.timer.cancel()
+
+        # Run in a fresh context so the batch doesn't inherit the deadline of whoever opened it
+        task = contextvars.Context().run(
+            asyncio.ensure_future,
+            self.send(playlist_id, batch, self.sending.get(playlist_id)))
+        self.sending[playlist_id] = task
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        task.add_done_callback(lambda _: self.sending.pop(playlist_id) if self.sending.get(playlist_id) is task else None)
+
+    async def send(self, playlist_id: str, batch: Batch, previous: Optional[asyncio.Task]):
+        """Make the request and report back to every caller."""
+
+        if previous is not None:
+            await asyncio.wait((previous,))
+
+        uris = [uri for uri, _ in batch.items]
+        self.requests += 1
+        self.items += len(uris)
+
+        try:
+            await batch.spotify.aadd_items_to_playlist(playlist_id, uris)
+        except Exception as error:
+            if isinstance(error, BotError):
+                logger.warning("failed to add %d tracks to playlist %s", len(uris), playlist_id)
+            else:
+                logger.error("failed to add %d tracks to playlist %s", len(uris), playlist_id, exc_info=error)
+            for _, future in batch.items:
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            for _, future in batch.items:
+                if not future.done():
+                    future.set_result(None)
+
+    async def close(self):
+        """Send everything pending and wait for it."""
+
+        for playlist_id in list(self.pending):
+            self.flush(playlist_id)
+        if self.tasks:
+            await asyncio.wait(self.tasks)
+
+    def stats(self) -> Dict[str, int]:
+        """Requests made versus tracks added."""
+
+        return {"pending": sum(len(batch.items) for batch in self.pending.values()), "requests": self.requests, "items": self.items}
@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.utils import timezone
+
+import logging
+import os
+import socket
+from datetime import timedelta
+from typing import List
+
+from core.models import TwitchShard
+from common.errors import InternalError
+from common.hashing import HashRing
+
+__all__ = (
+    "ShardMembership",)
+
+logger = logging.getLogger(__name__)
+
+
+class ShardMembership:
+    """This process's claim on a shard and its view of the others.
+
+    Shards coordinate through TwitchShard rows: each process claims the
+    row for its index and touches it on every heartbeat. Channels are
+    assigned by hashing their login onto a ring of the shards whose
+    heartbeat is recent, so when one stops the others pick up its
+    channels and when it returns only its share moves back.
+    """
+
+    index: int
+    shards: int
+    ttl: timedelta
+    host: str
+    live: List[int]
+    ring: HashRing[int]
+
+    def __init__(self, index: int, shards: int, ttl: timedelta = timedelta(minutes=1)):
+        """Start out assuming this is the only shard."""
+
+        self.index = index
+        self.shards = shards
+        self.ttl = ttl
+        self.host = f"{socket.gethostname()}:{os.getpid()}"
+        self.live = [index]
+        self.ring = HashRing(self.live)
+
+    def claim(self):
+        """Take this shard's row, failing if another process holds it."""
+
+        now = timezone.now()
+        with transaction.atomic():
+            shard = TwitchShard.objects.select_for_update().filter(index=self.index).first()
+            if shard is not None and shard.host != self.host and shard.time_heartbeat > now - self.ttl:
+                raise InternalError(f"shard {self.index} is already held by {shard.host}")
+
+            TwitchShard.objects.update_or_create(
+                index=self.index,
+                defaults={"shards": self.shards, "host": self.host, "time_created": now, "time_heartbeat": now})
+
+        logger.info("claimed shard %d of %d as %s", self.index, self.shards, self.host)
+
+    def heartbeat(self) -> bool:
+        """Refresh our row and the ring, returning whether it changed."""
+
+        now = timezone.now()
+        if not TwitchShard.objects.filter(index=self.index, host=self.host).update(time_heartbeat=now):
+            self.claim()
+
+        rows = list(TwitchShard.objects.filter(time_heartbeat__gt=now - self.ttl).values_list("index", "shards"))
+        live = sorted({index for index, shards in rows if index < self.shards} | {self.index})
+        for index, shards in rows:
+            if shards != self.shards:
+                logger.warning("shard %d was started with %d shards, we have %d", index, shards, self.shards)
+
+        if live == self.live:
+            return False
+
+        logger.info("live shards changed from %s to %s", self.live, live)
+        self.live = live
+        self.ring = HashRing(live)
+        return True
+
+    def release(self):
+        """Drop our row so the other shards take over immediately."""
+
+        TwitchShard.objects.filter(index=self.index, host=self.host).delete()
+
+    def owns(self, twitch_login: str) -> bool:
+        """Check whether a channel is assigned to this shard."""
+
+        return self.ring.get(twitch_login) == self.index
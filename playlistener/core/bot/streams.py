@@ -0,0 +1,106 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+__all__ = (
+    "StreamSchedule",)
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+MINUTES_PER_DAY = 24 * 60
+
+
+class ChannelState:
+    """What the schedule remembers about one channel."""
+
+    __slots__ = ("time_checked", "time_live", "starts", "time_next")
+
+    def __init__(self):
+        """Unknown channels are due immediately."""
+
+        self.time_checked: Optional[float] = None
+        self.time_live: Optional[float] = None
+        self.starts: List[int] = []
+        self.time_next = 0.0
+
+
+class StreamSchedule:
+    """Decides which channels to check on each poll.
+
+    Channels that are live, were live in the last hour or usually start
+    streaming around now are checked every poll. The rest are checked
+    less often the longer they have been offline, down to every
+    interval * dormant_factor seconds for channels not seen live in a
+    week. Channels never seen live count as offline since they were
+    first checked. Times are in seconds from the caller's clock.
+    """
+
+    STARTS = 5
+    EXPECTED_WINDOW = 60
+
+    interval: float
+    channels: Dict[str, ChannelState]
+
+    def __init__(self, interval: float, dormant_factor: float = 20):
+        """Set how often the most active channels are checked."""
+
+        self.interval = interval
+        self.dormant_factor = dormant_factor
+        self.channels = {}
+
+    def due(self, logins: Iterable[str], now: float) -> List[str]:
+        """Pick the channels to check now, forgetting any not passed."""
+
+        channels = {}
+        due = []
+        for login in logins:
+            state = channels[login] = self.channels.get(login) or ChannelState()
+            if state.time_next <= now:
+                due.append(login)
+        self.channels = channels
+        return due
+
+    def expected(self, state: ChannelState, wall: datetime) -> bool:
+        """Check if now is close to a time of day the channel went live."""
+
+        minute = wall.hour * 60 + wall.minute
+        for start in state.starts:
+            distance = abs(minute - start)
+            if min(distance, MINUTES_PER_DAY - distance) <= self.EXPECTED_WINDOW:
+                return True
+        return False
+
+    def next_interval(self, state: ChannelState, now: float, wall: datetime) -> float:
+        """How long to wait before checking a channel again."""
+
+        offline = now - (state.time_live if state.time_live is not None else state.time_checked)
+        if offline < HOUR or self.expected(state, wall):
+            return self.interval
+        if offline < DAY:
+            return self.interval * 2
+        if offline < 7 * DAY:
+            return self.interval * 4
+        return self.interval * self.dormant_factor
+
+    def observe(self, login: str, started_at: Optional[datetime], now: float, wall: datetime):
+        """Record a check, with the stream's start time if it was live."""
+
+        state = self.channels.get(login)
+        if state is None:
+            state = self.channels[login] = ChannelState()
+        if state.time_checked is None:
+            state.time_checked = now
+
+        if started_at is not None:
+            start = started_at.hour * 60 + started_at.minute
+            if start not in state.starts:
+                state.starts = (state.starts + [start])[-self.STARTS:]
+            state.time_live = now
+
+        # Spread checks out so a batch of dormant channels doesn't come due together
+        interval = self.next_interval(state, now, wall)
+        state.time_next = now + interval - (hash(login) % 1000) / 1000 * min(interval / 4, self.interval)
+
+    def stats(self) -> Dict[str, int]:
+        """Count channels and those ever seen live."""
+
+        return {"channels": len(self.channels), "seen_live": sum(state.time_live is not None for state in self.channels.values())}
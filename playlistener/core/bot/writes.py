@@ -0,0 +1,168 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Optional, Set, Tuple
+
+from core.models import TwitchIntegration, TwitchIntegrationUser
+
+__all__ = (
+    "WriteBuffer",
+    "writes",)
+
+logger = logging.getLogger(__name__)
+
+Cooldown = Tuple[Optional[timezone.datetime], bool]
+
+
+class WriteBuffer:
+    """Collects queue counts, cooldowns and bans so commands don't write.
+
+    Counts are flushed as F() increments and cooldowns and bans with
+    bulk_update, all in one transaction. Until a flush commits, apply
+    overlays pending values on users loaded from the database so the
+    bot never acts on a stale cooldown.
+    """
+
+    integration_counts: Counter
+    user_counts: Counter
+    cooldowns: Dict[int, Cooldown]
+    bans: Dict[int, bool]
+
+    def __init__(self):
+        """Start empty."""
+
+        self.lock = threading.Lock()
+        self.integration_counts = Counter()
+        self.user_counts = Counter()
+        self.cooldowns = {}
+        self.bans = {}
+        self.flushing: Tuple[Counter, Counter, Dict[int, Cooldown], Dict[int, bool]] = (Counter(), Counter(), {}, {})
+
+    def count_queue(self, integration_id: int, user_id: int):
+        """Record a successful queue."""
+
+        with self.lock:
+            self.integration_counts[integration_id] += 1
+            self.user_counts[user_id] += 1
+
+    def set_cooldown(self, user_id: int, time_cooldown: Optional[timezone.datetime], manual_cooldown: bool):
+        """Record a user's new cooldown."""
+
+        with self.lock:
+            self.cooldowns[user_id] = (time_cooldown, manual_cooldown)
+
+    def set_banned(self, user_id: int, banned: bool):
+        """Record a user being banned or unbanned."""
+
+        with self.lock:
+            self.bans[user_id] = banned
+
+    def release_cooldown(self, user_id: int, reserved: timezone.datetime, previous: Optional[timezone.datetime]):
+        """Undo a reserved cooldown unless it has since been replaced."""
+
+        with self.lock:
+            time_cooldown, manual_cooldown = self.get_cooldown(user_id) or (reserved, False)
+            if time_cooldown == reserved:
+                self.cooldowns[user_id] = (previous, manual_cooldown)
+
+    def get_cooldown(self, user_id: int) -> Optional[Cooldown]:
+        """Get the newest pending cooldown; call with the lock held."""
+
+        cooldown = self.cooldowns.get(user_id)
+        if cooldown is None:
+            cooldown = self.flushing[2].get(user_id)
+        return cooldown
+
+    def get_banned(self, user_id: int) -> Optional[bool]:
+        """Get the newest pending ban; call with the lock held."""
+
+        banned = self.bans.get(user_id)
+        if banned is None:
+            banned = self.flushing[3].get(user_id)
+        return banned
+
+    def pending_users(self) -> Set[int]:
+        """Get users with a cooldown or ban not yet written."""
+
+        with self.lock:
+            return {*self.cooldowns, *self.flushing[2], *self.bans, *self.flushing[3]}
+
+    def apply(self, user: TwitchIntegrationUser) -> TwitchIntegrationUser:
+        """Overlay pending writes on a user loaded from the database."""
+
+        with self.lock:
+            user.queue_count += self.user_counts[user.pk] + self.flushing[1][user.pk]
+            cooldown = self.get_cooldown(user.pk)
+            if cooldown is not None:
+                user.time_cooldown, user.manual_cooldown = cooldown
+            banned = self.get_banned(user.pk)
+            if banned is not None:
+                user.banned = banned
+        return user
+
+    def pending_queue_count(self, integration_id: int) -> int:
+        """Get queues not yet added to an integration's count."""
+
+        with self.lock:
+            return self.integration_counts[integration_id] + self.flushing[0][integration_id]
+
+    def pending_user_queue_count(self, user_id: int) -> int:
+        """Get queues not yet added to a user's count."""
+
+        with self.lock:
+            return self.user_counts[user_id] + self.flushing[1][user_id]
+
+    def flush(self):
+        """Write everything collected so far."""
+
+        with self.lock:
+            if not self.integration_counts and not self.user_counts and not self.cooldowns and not self.bans:
+                return
+            self.flushing = (self.integration_counts, self.user_counts, self.cooldowns, self.bans)
+            self.integration_counts = Counter()
+            self.user_counts = Counter()
+            self.cooldowns = {}
+            self.bans = {}
+
+        integration_counts, user_counts, cooldowns, bans = self.flushing
+        try:
+            with transaction.atomic():
+                for integration_id, count in integration_counts.items():
+                    TwitchIntegration.objects.filter(pk=integration_id).update(queue_count=F("queue_count") + count)
+                for user_id, count in user_counts.items():
+                    TwitchIntegrationUser.objects.filter(pk=user_id).update(queue_count=F("queue_count") + count)
+                TwitchIntegrationUser.objects.bulk_update(
+                    [
+                        TwitchIntegrationUser(pk=user_id, time_cooldown=time_cooldown, manual_cooldown=manual_cooldown)
+                        for user_id, (time_cooldown, manual_cooldown) in cooldowns.items()
+                    ],
+                    fields=("time_cooldown", "manual_cooldown"))
+                TwitchIntegrationUser.objects.bulk_update(
+                    [TwitchIntegrationUser(pk=user_id, banned=banned) for user_id, banned in bans.items()],
+                    fields=("banned",))
+
+        except Exception:
+            with self.lock:
+                self.integration_counts.update(integration_counts)
+                self.user_counts.update(user_counts)
+                self.cooldowns = {**cooldowns, **self.cooldowns}
+                self.bans = {**bans, **self.bans}
+            raise
+
+        finally:
+            with self.lock:
+                self.flushing = (Counter(), Counter(), {}, {})
+
+        logger.debug(
+            "flushed %d integration counts, %d user counts, %d cooldowns, %d bans",
+            len(integration_counts),
+            len(user_counts),
+            len(cooldowns),
+            len(bans))
+
+
+writes = WriteBuffer()
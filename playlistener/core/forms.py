@@ -51,7 +51,7 @@ class TwitchIntegrationForm(forms.ModelForm):
         try:
             playlist_data = self.instance.user.spotify.get_playlist(playlist_id)
             user_data = self.instance.user.spotify.get_me()
-            if playlist_data["owner"]["id"] != user_data["id"]:
+            if playlist_data.owner_id != user_data.id:
                 raise forms.ValidationError("Spotify playlist is not owned by authorized user!")
         except UsageError:
             raise forms.ValidationError("Playlist does not exist!")
@@ -0,0 +1,77 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Model
+
+from itertools import islice
+from typing import List, Type
+
+
+def sort_models(models: List[Type[Model]]) -> List[Type[Model]]:
+    """Order models so every foreign key points at one copied before it."""
+
+    remaining = {model: {
+        field.related_model
+        for field in model._meta.concrete_fields
+        if field.is_relation and field.related_model is not model and field.related_model in models}
+        for model in models}
+
+    ordered = []
+    while remaining:
+        ready = [model for model, dependencies in remaining.items() if not dependencies - set(ordered)]
+        if not ready:
+            raise CommandError(f"circular foreign keys between {', '.join(model.__name__ for model in remaining)}")
+        for model in ready:
+            ordered.append(model)
+            del remaining[model]
+
+    return ordered
+
+
+class Command(BaseCommand):
+    """Copy every table from one configured database to another.
+
+    Meant for moving off SQLite: add the old database to DATABASES
+    under another alias, migrate the new one, then copy. Rows are read
+    and written in batches so large tables never sit in memory, and the
+    target is emptied first so rows keep their primary keys.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="alias of the database to copy from")
+        parser.add_argument("target", help="alias of the migrated database to copy into, which is emptied")
+        parser.add_argument("--batch", type=int, default=1000, help="rows read and written at a time")
+
+    def handle(self, source, target, *args, **options):
+        """Flush the target, copy models in dependency order, fix sequences."""
+
+        for alias in (source, target):
+            if alias not in settings.DATABASES:
+                raise CommandError(f"no database configured as {alias}")
+        if source == target:
+            raise CommandError("source and target must differ")
+
+        # Copied content types and permissions replace those migrate created
+        call_command("flush", database=target, interactive=False, inhibit_post_migrate=True, verbosity=0)
+
+        models = sort_models([
+            model
+            for model in apps.get_models(include_auto_created=True)
+            if model._meta.managed and not model._meta.proxy])
+
+        with transaction.atomic(using=target):
+            for model in models:
+                rows = model._base_manager.using(source).order_by("pk").iterator(chunk_size=options["batch"])
+                copied = 0
+                while batch := list(islice(rows, options["batch"])):
+                    model._base_manager.using(target).bulk_create(batch)
+                    copied += len(batch)
+                self.stdout.write(f"copied {copied} rows of {model._meta.label}")
+
+            statements = connections[target].ops.sequence_reset_sql(no_style(), models)
+            with connections[target].cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
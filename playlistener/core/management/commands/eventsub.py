@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+import json
+import uuid
+
+import requests
+
+from core.models import TwitchIntegration
+from core.bot.eventsub import STREAM_ONLINE, STREAM_OFFLINE, sign
+from common.http import TIMEOUT_SECONDS
+
+
+class Command(BaseCommand):
+    """Send a signed EventSub notification to a running bot.
+
+    Stands in for Twitch when testing offline, e.g. against a bot
+    started with --eventsub-callback http://localhost:8080/eventsub.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("event", choices=("online", "offline", "challenge", "revocation"))
+        parser.add_argument("twitch_login")
+        parser.add_argument("--url", default="http://localhost:8080/eventsub")
+        parser.add_argument("--repeat", type=int, default=1, help="deliveries of the same message, to test duplicates")
+        parser.add_argument("--secret", default=None, help="sign with this instead of TWITCH_EVENTSUB_SECRET")
+
+    def handle(self, event, twitch_login, *args, **options):
+        """Build the message the way Twitch would and deliver it."""
+
+        secret = options["secret"] or settings.TWITCH_EVENTSUB_SECRET
+        if not secret:
+            raise CommandError("TWITCH_EVENTSUB_SECRET must be set or --secret passed")
+
+        integration = TwitchIntegration.objects.filter(twitch_login=twitch_login).first()
+        twitch_id = integration.twitch_id if integration is not None else "0"
+
+        subscription_type = STREAM_OFFLINE if event == "offline" else STREAM_ONLINE
+        now = timezone.now()
+        payload = {
+            "subscription": {
+                "id": str(uuid.uuid4()),
+                "status": "authorization_revoked" if event == "revocation" else "enabled",
+                "type": subscription_type,
+                "version": "1",
+                "cost": 0,
+                "condition": {"broadcaster_user_id": twitch_id},
+                "transport": {"method": "webhook", "callback": options["url"]},
+                "created_at": now.isoformat().replace("+00:00", "Z")}}
+
+        if event == "challenge":
+            message_type = "webhook_callback_verification"
+            payload["challenge"] = str(uuid.uuid4())
+        elif event == "revocation":
+            message_type = "revocation"
+        else:
+            message_type = "notification"
+            payload["event"] = {
+                "broadcaster_user_id": twitch_id,
+                "broadcaster_user_login": twitch_login,
+                "broadcaster_user_name": twitch_login}
+            if event == "online":
+                payload["event"].update(id=str(uuid.uuid4()), type="live", started_at=payload["subscription"]["created_at"])
+
+        body = json.dumps(payload).encode()
+        message_id = str(uuid.uuid4())
+        timestamp = now.isoformat().replace("+00:00", "Z")
+        headers = {
+            "Content-Type": "application/json",
+            "Twitch-Eventsub-Message-Id": message_id,
+            "Twitch-Eventsub-Message-Retry": "0",
+            "Twitch-Eventsub-Message-Type": message_type,
+            "Twitch-Eventsub-Message-Signature": sign(secret, message_id, timestamp, body),
+            "Twitch-Eventsub-Message-Timestamp": timestamp,
+            "Twitch-Eventsub-Subscription-Type": subscription_type,
+            "Twitch-Eventsub-Subscription-Version": "1"}
+
+        for _ in range(options["repeat"]):
+            response = requests.post(options["url"], data=body, headers=headers, timeout=TIMEOUT_SECONDS)
+            self.stdout.write(f"{response.status_code} {response.text}".strip())
@@ -1,21 +1,42 @@
-from django.core.management.base import BaseCommand, CommandParser
+from django.core.management.base import BaseCommand, CommandError, CommandParser
 from django.conf import settings
 from django.utils import timezone
-from asgiref.sync import sync_to_async
 
-from core.models import TwitchIntegrationUser, TwitchIntegration
-from common.spotify import find_first_spotify_track_link, find_first_spotify_playlist_link
-from common.errors import UsageError, InternalError
+from core.models import TwitchIntegrationUser, TwitchIntegration, spotify_requests, spotify_circuits, spotify_reads
+from core.bot.integrations import IntegrationSnapshot, integrations
+from core.bot.writes import writes
+from core.bot.moderation import moderation
+from core.bot.playlists import PlaylistBatcher
+from core.bot.shards import ShardMembership
+from core.bot.eventsub import EventSubReceiver
+from core.bot.streams import StreamSchedule
+from core.bot.joins import JoinScheduler
+from core.bot.messages import MessagePipeline, PipelineContext
+from core.bot.nowplaying import NowPlayingPoller
+from core.bot.admission import (
+    AdmissionController,
+    PRIORITY_BROADCASTER,
+    PRIORITY_MODERATOR,
+    PRIORITY_SUBSCRIBER,
+    PRIORITY_VIEWER)
+from common.spotify import Track, find_first_spotify_track_link, find_first_spotify_playlist_link
+from common.tracks import tracks
+from common.errors import UsageError, InternalError, UnavailableError
+from common.http import TIMEOUT_SECONDS, close_async_client, deadline
+from common.executor import KeyedExecutor
+from common.oauth import tokens
 
 import requests
-from twitchio import Channel
+from twitchio import Channel, Stream
 from twitchio.ext.commands import command, cooldown, Bot, Context, Command, CommandNotFound, CommandOnCooldown
 from twitchio.ext.routines import routine, Routine
 
+import asyncio
 import logging
+import time
 from math import ceil
 from dataclasses import dataclass
-from typing import List, Callable, Coroutine, Iterable, Optional, Any, Dict, Set
+from typing import List, Callable, Coroutine, Dict, Iterable, Optional, Any, Set, Tuple
 
 
 logging.basicConfig(
@@ -23,6 +44,14 @@ logging.basicConfig(
     datefmt="%m/%d/%y %I:%M:%S %p")
 logger = logging.getLogger("twitch")
 
+# Total time the Spotify requests of one command may take
+COMMAND_BUDGET = 10
+
+# Stream polling; Helix takes at most 100 channels per request
+POLL_SECONDS = 15
+STREAMS_CHUNK = 100
+STREAMS_CONCURRENCY = 4
+
 
 @dataclass
 class TwitchAuthorization:
@@ -50,7 +79,7 @@ class TwitchAuthorization:
             "client_id": settings.TWITCH_CLIENT_ID,
             "client_secret": settings.TWITCH_CLIENT_SECRET,
             "grant_type": "refresh_token",
-            "refresh_token": self.refresh_token})
+            "refresh_token": self.refresh_token}, timeout=TIMEOUT_SECONDS)
 
         if response.status_code != 200:
             logger.error(
@@ -86,15 +115,14 @@ def describe_queue_destination(queued: bool, added: bool) -> str:
     return "playlist"
 
 
-def describe_track(track: dict, include_url: bool = False) -> str:
+def describe_track(track: Track, include_url: bool = False) -> str:
     """Join artists, append title."""
 
-    artists = ", ".join(artist["name"] for artist in track["artists"])
-    title = track["name"]
+    artists = ", ".join(track.artists)
+    title = track.name
 
     if include_url:
-        url = track["external_urls"]["spotify"].strip()
-        return f"{artists} - {title} {url}"
+        return f"{artists} - {title} {track.url}"
 
     else:
         return f"{artists} - {title}"
@@ -121,6 +149,21 @@ def try_float(value: str) -> Optional[float]:
         return None
 
 
+def try_int(value: str) -> Optional[int]:
+    """Try to parse an int."""
+
+    try:
+        return int(value.strip())
+    except ValueError:
+        return None
+
+
+def parse_name(value: str) -> str:
+    """Normalize a username typed in chat."""
+
+    return value.strip().lstrip("@").lower()
+
+
 def try_bool(value: str) -> Optional[bool]:
     """Try to parse a bool."""
 
@@ -143,13 +186,11 @@ def django_routine(*args, **kwargs) -> Callable[[RoutineCallback], Routine]:
     def decorator(synchronous: RoutineCallback) -> Routine:
         """Just invoke."""
 
-        asynchronous = sync_to_async(synchronous)
-
         async def actual(self):
             """Pass in a list for adding coroutines."""
 
             coroutines = []
-            await asynchronous(self, coroutines.append)
+            await self.executor.run(synchronous, self, coroutines.append)
             for coroutine in coroutines:
                 await coroutine
 
@@ -158,31 +199,45 @@ def django_routine(*args, **kwargs) -> Callable[[RoutineCallback], Routine]:
     return decorator
 
 
+async def check_permissions(context: Context, broadcaster_only: bool, mods_only: bool) -> bool:
+    """Tell the author off if they can't use a command."""
+
+    if broadcaster_only and not context.author.is_broadcaster:
+        await context.reply("sorry, you don't have permission to use this command!")
+        return False
+
+    if mods_only and not context.author.is_broadcaster and not context.author.is_mod:
+        await context.reply("sorry, you don't have permission to use this command!")
+        return False
+
+    return True
+
+
 def django_command(
         *args,
         broadcaster_only: bool = False,
         mods_only: bool = False,
         **kwargs) -> Callable[[CommandCallback], Command]:
-    """A complicated wrapper to streamline database access."""
+    """A complicated wrapper to streamline database access.
+
+    The synchronous callback runs on the bot's worker pool, ordered
+    after any other database work for the same channel. Coroutines it
+    defers are awaited afterwards on the event loop so that slow
+    Spotify requests don't hold up the channel or a worker.
+    """
 
     def decorator(synchronous: CommandCallback) -> Command:
         """Decorates a naive synchronous callback."""
 
-        asynchronous = sync_to_async(synchronous)
-
         async def actual(self, context: Context):
             """Pass in a list for adding coroutines to execute outside."""
 
-            if broadcaster_only and not context.author.is_broadcaster:
-                await context.reply("sorry, you don't have permission to use this command!")
-                return
-
-            if mods_only and not context.author.is_broadcaster and not context.author.is_mod:
-                await context.reply("sorry, you don't have permission to use this command!")
+            context = PipelineContext(context, self.messages)
+            if not await check_permissions(context, broadcaster_only, mods_only):
                 return
 
             coroutines = []
-            await asynchronous(self, context, coroutines.append)
+            await self.executor.run_serialized(context.channel.name, synchronous, self, context, coroutines.append)
             for coroutine in coroutines:
                 await coroutine
 
@@ -191,6 +246,38 @@ def django_command(
     return decorator
 
 
+AsyncCommandCallback = Callable[[Any, Context], Coroutine]
+
+
+def async_command(
+        *args,
+        broadcaster_only: bool = False,
+        mods_only: bool = False,
+        **kwargs) -> Callable[[AsyncCommandCallback], Command]:
+    """Same as django_command but for commands that run on the event loop.
+
+    Commands that can answer from the bot's caches never wait for the
+    worker pool; database work they do need is handed to the executor
+    by the command itself.
+    """
+
+    def decorator(asynchronous: AsyncCommandCallback) -> Command:
+        """Decorates a coroutine function."""
+
+        async def actual(self, context: Context):
+            """Check permissions and await the command."""
+
+            context = PipelineContext(context, self.messages)
+            if not await check_permissions(context, broadcaster_only, mods_only):
+                return
+
+            await asynchronous(self, context)
+
+        return command(*args, name=kwargs.get("name", asynchronous.__name__), **kwargs)(actual)
+
+    return decorator
+
+
 def error_handling() -> Callable[[CommandCallback], CommandCallback]:
     """Adds a layer of exception handling for Spotify API access."""
 
@@ -204,6 +291,9 @@ def error_handling() -> Callable[[CommandCallback], CommandCallback]:
                 callback(self, context, later)
             except UsageError as error:
                 later(context.reply(str(error)))
+            except UnavailableError as error:
+                logger.warning("unavailable in %s: %s", callback.__name__, error.details or error)
+                later(context.reply(str(error)))
             except InternalError as error:
                 logging.error("caught error in %s: ", callback.__name__, exc_info=error)
                 later(context.send(f"error: {error}"))
@@ -214,6 +304,25 @@ def error_handling() -> Callable[[CommandCallback], CommandCallback]:
     return decorator
 
 
+async def handle_errors(context: Context, coroutine: Coroutine, budget: float = COMMAND_BUDGET):
+    """Same as error_handling but for deferred Spotify coroutines.
+
+    The coroutine's Spotify requests share a deadline of budget seconds.
+    """
+
+    try:
+        with deadline(budget):
+            await coroutine
+    except UsageError as error:
+        await context.reply(str(error))
+    except UnavailableError as error:
+        logger.warning("unavailable in %s: %s", coroutine.__qualname__, error.details or error)
+        await context.reply(str(error))
+    except InternalError as error:
+        logger.error("caught error in %s: ", coroutine.__qualname__, exc_info=error)
+        await context.send(f"error: {error}")
+
+
 IntegrationCallback = Callable[[Any, Context, Later, TwitchIntegration], None]
 
 
@@ -237,25 +346,58 @@ def with_integration(select_related: Iterable[str] = ()) -> Callable[[Integratio
     return decorator
 
 
-IntegrationUserCallback = Callable[[Any, Context, Later, TwitchIntegration, TwitchIntegrationUser], None]
+SnapshotCallback = Callable[[Any, Context, Later, IntegrationSnapshot], None]
+
+
+def with_snapshot() -> Callable[[SnapshotCallback], CommandCallback]:
+    """Same as with_integration but read from the bot's snapshot cache."""
+
+    def decorator(callback: SnapshotCallback) -> CommandCallback:
+        """Wrap the snapshot lookup."""
+
+        def actual(self, context: Context, later: Later):
+            """Only invoke if integration exists."""
+
+            snapshot = integrations.get(context.channel.name)
+            if snapshot is not None:
+                callback(self, context, later, snapshot)
+
+        actual.__name__ = callback.__name__
+        return actual
+
+    return decorator
+
+
+def save_user(user: TwitchIntegrationUser) -> TwitchIntegrationUser:
+    """Save a default user with its cooldown, unless it was saved meanwhile."""
+
+    saved, created = TwitchIntegrationUser.objects.get_or_create_named(
+        user.integration_id,
+        user.name,
+        time_cooldown=user.time_cooldown,
+        manual_cooldown=user.manual_cooldown)
+    if not created:
+        writes.set_cooldown(saved.pk, user.time_cooldown, user.manual_cooldown)
+    return saved
 
 
-def with_user() -> Callable[[IntegrationUserCallback], IntegrationCallback]:
-    """Look up the corresponding integration user model."""
+AsyncSnapshotCallback = Callable[[Any, Context, IntegrationSnapshot], Coroutine]
 
-    def decorator(callback: IntegrationUserCallback) -> IntegrationCallback:
-        """Wrap the user access."""
 
-        def actual(self, context: Context, later: Later, integration: TwitchIntegration):
-            """Save the user if created."""
+def awith_snapshot() -> Callable[[AsyncSnapshotCallback], AsyncCommandCallback]:
+    """Same as with_snapshot for commands on the event loop."""
 
-            user, created = TwitchIntegrationUser.objects.get_or_create(
-                integration=integration,
-                name=context.author.name)
-            if created:
-                user.save()
+    def decorator(callback: AsyncSnapshotCallback) -> AsyncCommandCallback:
+        """Wrap the snapshot lookup."""
 
-            callback(self, context, later, integration, user)
+        async def actual(self, context: Context):
+            """Only use a worker if the snapshot isn't cached."""
+
+            snapshot = integrations.snapshots.get(context.channel.name)
+            if snapshot is None:
+                snapshot = await self.executor.run(integrations.get, context.channel.name)
+            if snapshot is not None:
+                await callback(self, context, snapshot)
 
         actual.__name__ = callback.__name__
         return actual
@@ -263,36 +405,101 @@ def with_user() -> Callable[[IntegrationUserCallback], IntegrationCallback]:
     return decorator
 
 
-@sync_to_async
-def get_twitch_integrations() -> Dict[str, TwitchIntegration]:
-    """Get all Twitch integrations from Django asynchronously."""
+def count_queues(integration_id: int, name: str) -> Tuple[int, int]:
+    """Get how many songs a user and the whole channel have queued."""
+
+    queue_count = TwitchIntegration.objects.filter(pk=integration_id).values_list("queue_count", flat=True).first()
+    user = TwitchIntegrationUser.objects.filter(integration_id=integration_id).named(name).only("id", "queue_count").first()
 
-    return {
-        integration.twitch_login: integration
-        for integration in TwitchIntegration.objects.all()}
+    user_count = user.queue_count + writes.pending_user_queue_count(user.pk) if user is not None else 0
+    return user_count, (queue_count or 0) + writes.pending_queue_count(integration_id)
 
 
 class TwitchBot(Bot):
     """Listens for commands and handles Spotify integration."""
 
     authorization: TwitchAuthorization
+    executor: KeyedExecutor
+    playlists: PlaylistBatcher
+    shard: Optional[ShardMembership]
+    eventsub: Optional[EventSubReceiver]
     joined: Set[str]
-
-    def __init__(self):
+    stream_events: Dict[str, float]
+    streams: StreamSchedule
+    joins: JoinScheduler
+    messages: MessagePipeline
+    admission: AdmissionController
+    nowplaying: NowPlayingPoller
+
+    def __init__(
+            self,
+            workers: int,
+            playlist_window: float,
+            shard: Optional[ShardMembership] = None,
+            eventsub_callback: Optional[str] = None,
+            eventsub_port: int = 8080):
         """Initialize the bot and look for integrations."""
 
-        logger.info("initializing bot")
+        logger.info("initializing bot with %d workers", workers)
         self.authorization = TwitchAuthorization.request(settings.TWITCH_REFRESH_TOKEN)
+        self.executor = KeyedExecutor(workers)
+        self.playlists = PlaylistBatcher(window=playlist_window)
+        self.shard = shard
+        self.eventsub = None
+        if eventsub_callback is not None:
+            self.eventsub = EventSubReceiver(
+                settings.TWITCH_EVENTSUB_SECRET,
+                eventsub_callback,
+                on_online=self.stream_online,
+                on_offline=self.stream_offline)
+        self.eventsub_port = eventsub_port
         self.joined = set()
+        self.stream_events = {}
+        self.streams = StreamSchedule(interval=POLL_SECONDS)
 
         super().__init__(token=self.authorization.access_token, prefix="?")
+        self.joins = JoinScheduler(self.join_channels)
+        self.messages = MessagePipeline()
+        self.admission = AdmissionController()
+        self.nowplaying = NowPlayingPoller(lambda twitch_login: integrations.snapshots.get(twitch_login))
 
     async def event_ready(self):
         """Print locally for verification."""
 
         logger.info("logged in as %s", self.nick)
-        self.synchronize.start()
+        await self.executor.run(integrations.fill)
+        self.joins.start()
+        self.expire_cooldowns.start()
+        if self.shard is not None:
+            await self.executor.run(self.shard.heartbeat)
+            self.heartbeat.start()
+
+        if self.eventsub is not None:
+            await self.eventsub.start("0.0.0.0", self.eventsub_port)
+            self.reconcile.start()
+        else:
+            self.poll.start()
+
         self.notify.start()
+        self.refresh_tokens.start()
+        self.flush_writes.start()
+        self.report.start()
+
+    async def close(self):
+        """Flush pending writes, release connections and workers."""
+
+        if self.eventsub is not None:
+            await self.eventsub.stop()
+        self.joins.stop()
+        await self.nowplaying.close()
+        await self.playlists.close()
+        await self.messages.close()
+        await self.executor.run(writes.flush)
+        await close_async_client()
+        if self.shard is not None:
+            await self.executor.run(self.shard.release)
+        await super().close()
+        self.executor.shutdown()
 
     async def event_token_expired(self):
         """Print locally."""
@@ -306,7 +513,7 @@ class TwitchBot(Bot):
         if isinstance(error, CommandNotFound):
             return
         elif isinstance(error, CommandOnCooldown):
-            await context.reply(f"sorry, this command is on cooldown for {ceil(error.retry_after)} seconds!")
+            await self.messages.reply(context, f"sorry, this command is on cooldown for {ceil(error.retry_after)} seconds!")
             return
 
         await super().event_command_error(context, error)
@@ -314,64 +521,233 @@ class TwitchBot(Bot):
     async def event_channel_joined(self, channel: Channel):
         """Notify the channel!"""
 
-        await channel.send(f"{channel.name}'s queue is active!")
+        self.joins.joined(channel.name)
+        await self.executor.run_serialized(channel.name, moderation.load, channel.name)
+        self.nowplaying.start(channel.name)
+        await self.messages.send(channel, f"{channel.name}'s queue is active!")
 
     async def event_channel_join_failure(self, channel: str):
-        """Remove from joined set."""
+        """Retry, or remove from joined set so synchronize tries again."""
+
+        if not self.joins.failed(channel):
+            self.joined.discard(channel)
+            logger.error("failed to join channel %s", channel)
+
+    def owns(self, twitch_login: str) -> bool:
+        """Check whether this process is responsible for a channel."""
+
+        return self.shard is None or self.shard.owns(twitch_login)
+
+    async def fetch_live(self, snapshots: List[IntegrationSnapshot]) -> Tuple[Set[str], Dict[str, Stream]]:
+        """Get which channels were checked and the streams of live ones.
 
-        self.joined.remove(channel)
-        logger.error("failed to join channel %s", channel)
+        Channels are requested in chunks, several at a time. A chunk that
+        fails is left out of the checked channels rather than read as
+        offline.
+        """
 
-    @routine(seconds=15)
-    async def synchronize(self):
-        """Check if streams are live, join or part channels."""
+        semaphore = asyncio.Semaphore(STREAMS_CONCURRENCY)
 
-        integrations = await get_twitch_integrations()
-        streams = await self.fetch_streams(user_logins=integrations.keys())
+        async def fetch(chunk: List[IntegrationSnapshot]) -> list:
+            """Fetch one chunk under the concurrency cap."""
 
-        join = []
-        for stream in streams:
-            integration = integrations.pop(stream.user.name)
-            if integration.twitch_login not in self.joined:
-                join.append(integration.twitch_login)
-                self.joined.add(integration.twitch_login)
+            async with semaphore:
+                return await self.fetch_streams(user_ids=[int(snapshot.twitch_id) for snapshot in chunk])
 
-        part = []
-        for integration in integrations.values():
-            if integration.twitch_login in self.joined:
-                part.append(integration.twitch_login)
-                self.joined.remove(integration.twitch_login)
+        chunks = [snapshots[i:i + STREAMS_CHUNK] for i in range(0, len(snapshots), STREAMS_CHUNK)]
+        results = await asyncio.gather(*map(fetch, chunks), return_exceptions=True)
+
+        checked = set()
+        live = {}
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                logger.warning("failed to fetch streams for %d channels", len(chunk), exc_info=result)
+                continue
+
+            logins = {snapshot.twitch_id: snapshot.twitch_login for snapshot in chunk}
+            checked.update(logins.values())
+            for stream in result:
+                login = logins.get(str(stream.user.id))
+                if login is not None:
+                    live[login] = stream
+
+        return checked, live
+
+    async def synchronize(self, full: bool = False):
+        """Check if streams are live, join or part channels.
+
+        Joined channels are checked every time, others only when the
+        stream schedule says they're due unless full is set. When
+        sharded, only channels assigned to this shard are checked and
+        channels that moved to another shard are parted. Channels that
+        had an EventSub event while streams were fetched are left alone
+        since the event is newer.
+        """
+
+        started = time.monotonic()
+        snapshots = await self.executor.run(integrations.sync)
+        owned = {login: snapshot for login, snapshot in snapshots.items() if self.owns(login)}
+
+        if self.eventsub is not None:
+            try:
+                await self.eventsub.reconcile(snapshot.twitch_id for snapshot in owned.values())
+            except InternalError as error:
+                logger.error("failed to reconcile EventSub subscriptions", exc_info=error)
+
+        due = self.streams.due(owned, started)
+        checking = set(owned) if full else set(due) | (self.joined & owned.keys())
+        checked, live = await self.fetch_live([owned[login] for login in sorted(checking)])
+
+        now, wall = time.monotonic(), timezone.now()
+        for login in checked:
+            self.streams.observe(login, live[login].started_at if login in live else None, now, wall)
+
+        recent = {login for login, time_event in self.stream_events.items() if time_event >= started}
+        self.stream_events = {login: self.stream_events[login] for login in recent}
+
+        join = sorted(live.keys() - self.joined - recent)
+        part = sorted(((self.joined & checked) - live.keys() | self.joined - owned.keys()) - recent)
+        self.joined.update(join)
+        self.joined.difference_update(part)
 
         if join:
-            logger.info("joining", ", ".join(join))
-            await self.join_channels(join)
+            logger.info("joining %s", ", ".join(join))
+            for login in join:
+                self.joins.add(login, live[login].viewer_count, live[login].started_at)
 
         if part:
-            logger.info("leaving", ", ".join(part))
+            logger.info("leaving %s", ", ".join(part))
+            for login in part:
+                self.joins.discard(login)
+                moderation.drop(login)
+                self.nowplaying.stop(login)
             await self.part_channels(part)
 
+        duration = time.monotonic() - started
         if join or part:
+            logger.info(
+                "synchronized %d of %d channels in %.2fs, joined %d and left %d",
+                len(checked), len(owned), duration, len(join), len(part))
             logger.debug("currently present in %d channels: %s", len(self.joined), ", ".join(self.joined))
+        else:
+            logger.debug("synchronized %d of %d channels in %.2fs, no changes", len(checked), len(owned), duration)
+
+    @routine(seconds=POLL_SECONDS)
+    async def poll(self):
+        """Poll for streams going live or offline."""
+
+        await self.synchronize()
+
+    @routine(minutes=10)
+    async def reconcile(self):
+        """Catch anything EventSub missed and keep subscriptions current."""
+
+        await self.synchronize(full=True)
+
+    @routine(seconds=15, wait_first=True)
+    async def heartbeat(self):
+        """Keep our shard alive and pick up channels if the others change."""
+
+        try:
+            changed = await self.executor.run(self.shard.heartbeat)
+        except Exception as error:
+            logger.error("failed to heartbeat shard %d, will retry", self.shard.index, exc_info=error)
+            return
+
+        if changed:
+            await self.synchronize(full=True)
+
+    async def stream_online(self, twitch_login: str):
+        """Join a channel as soon as EventSub says it went live."""
+
+        self.stream_events[twitch_login] = time.monotonic()
+        snapshot = await self.executor.run(integrations.get, twitch_login)
+        if snapshot is None or not self.owns(twitch_login) or twitch_login in self.joined:
+            return
+
+        logger.info("joining %s", twitch_login)
+        self.joined.add(twitch_login)
+        self.joins.add(twitch_login)
+
+    async def stream_offline(self, twitch_login: str):
+        """Leave a channel as soon as EventSub says it went offline."""
+
+        self.stream_events[twitch_login] = time.monotonic()
+        if twitch_login not in self.joined:
+            return
+
+        logger.info("leaving %s", twitch_login)
+        self.joined.discard(twitch_login)
+        self.joins.discard(twitch_login)
+        moderation.drop(twitch_login)
+        self.nowplaying.stop(twitch_login)
+        await self.part_channels([twitch_login])
+
+    @routine(minutes=1)
+    async def refresh_tokens(self):
+        """Refresh Spotify tokens ahead of expiry so commands never wait."""
+
+        await tokens.refresh_expiring(
+            snapshot.spotify
+            for snapshot in list(integrations.snapshots.values())
+            if snapshot.spotify is not None and self.owns(snapshot.twitch_login))
+
+    @routine(seconds=2)
+    async def flush_writes(self):
+        """Write collected queue counts and cooldowns."""
+
+        try:
+            await self.executor.run(writes.flush)
+        except Exception as error:
+            logger.error("failed to flush writes, will retry", exc_info=error)
+
+    @routine(seconds=1)
+    async def expire_cooldowns(self):
+        """Forget cooldowns that have run out."""
+
+        moderation.expire()
+
+    @routine(minutes=5)
+    async def report(self):
+        """Log cache and pipeline statistics."""
+
+        logger.info("track cache: %s", tracks.stats())
+        logger.info("playlist batches: %s", self.playlists.stats())
+        logger.info("spotify requests: %s", spotify_requests.stats())
+        logger.info("spotify circuits: %s", spotify_circuits.stats())
+        logger.info("spotify reads: %s", spotify_reads.stats())
+        if self.eventsub is not None:
+            logger.info("eventsub: %s", self.eventsub.stats())
+        logger.info("stream schedule: %s", self.streams.stats())
+        logger.info("joins: %s", self.joins.stats())
+        logger.info("messages: %s", self.messages.stats())
+        logger.info("queue admission: %s", self.admission.stats())
+        logger.info("moderation: %s", moderation.stats())
+        logger.info("now playing: %s", self.nowplaying.stats())
+        logger.info("integration snapshots: %s", integrations.stats())
 
     @django_routine(minutes=15)
     def notify(self, later: Later):
         """Notify everyone about queueing."""
 
         for channel in self.connected_channels:
-            integration = TwitchIntegration.objects.filter(channel=channel.name).first()
-            if integration is None:
+            snapshot = integrations.get(channel.name)
+            if snapshot is None:
                 continue
 
-            if integration.enabled and (integration.add_to_queue or integration.add_to_playlist):
-                later(channel.send(f"use ?queue to add Spotify songs to {integration.user.first_name}'s playlist"))
+            if snapshot.enabled and (snapshot.add_to_queue or snapshot.add_to_playlist):
+                later(self.messages.send(channel, f"use ?queue to add Spotify songs to {snapshot.first_name}'s playlist"))
 
     @cooldown(rate=3, per=30)
     @django_command()
     @error_handling()
-    @with_integration(select_related=("user", "user__spotify"))
-    @with_user()
-    def queue(self, context: Context, later: Later, integration: TwitchIntegration, user: TwitchIntegrationUser):
-        """Add a song to the queue or playlist."""
+    @with_snapshot()
+    def queue(self, context: Context, later: Later, integration: IntegrationSnapshot):
+        """Add a song to the queue or playlist.
+
+        Bans and cooldowns are checked in memory, so turning a user away
+        doesn't touch the database.
+        """
 
         if not integration.enabled:
             later(context.reply(f"sorry, playlistener has been turned off!"))
@@ -388,140 +764,202 @@ class TwitchBot(Bot):
             return
 
         if " " not in context.message.content.strip():
-            first_name = integration.user.first_name
+            first_name = integration.first_name
             destination = describe_queue_destination(integration.add_to_queue, integration.add_to_playlist)
             later(context.reply(f"use this command to add Spotify links to {first_name}'s {destination}"))
             return
 
-        if user.banned:
+        if moderation.is_banned(context.channel.name, context.author.name):
             later(context.reply("sorry, you're banned from queueing songs!"))
             return
 
-        if user.time_cooldown is not None and user.time_cooldown > timezone.now():
-            difference = user.time_cooldown - timezone.now()
+        cooldown = moderation.get_cooldown(context.channel.name, context.author.name)
+        if cooldown is not None:
+            time_cooldown, manual_cooldown = cooldown
+            difference = time_cooldown - timezone.now()
             message = f"sorry, you have to wait {ceil(difference.seconds)} seconds to queue again!"
 
             is_tiered = integration.queue_cooldown_subscriber < integration.queue_cooldown
-            if not user.manual_cooldown and not context.author.is_subscriber and not is_admin and is_tiered:
+            if not manual_cooldown and not context.author.is_subscriber and not is_admin and is_tiered:
                 message += f" subscribe to only wait {ceil(integration.queue_cooldown_subscriber)} seconds per queue."
 
             later(context.reply(message))
             return
 
-        else:
-            user.manual_cooldown = False
-
         match = find_first_spotify_track_link(context.message.content)
         if match is None:
             later(context.reply("sorry, I couldn't find a Spotify track link in your message!"))
             return
 
+        # The user is saved once the queue goes through, see queue_track
+        user = TwitchIntegrationUser.objects.filter(integration_id=integration.id).named(context.author.name).first()
+        if user is None:
+            user = TwitchIntegrationUser(integration_id=integration.id, name=context.author.name)
+        else:
+            writes.apply(user)
+        user.manual_cooldown = False
+
+        if context.author.is_broadcaster:
+            priority = PRIORITY_BROADCASTER
+        elif context.author.is_mod:
+            priority = PRIORITY_MODERATOR
+        elif context.author.is_subscriber:
+            priority = PRIORITY_SUBSCRIBER
+        else:
+            priority = PRIORITY_VIEWER
+
+        ticket = self.admission.admit(context.channel.name, priority, integration.queue_backlog, integration.queue_wait)
+        if ticket is None:
+            later(context.reply("sorry, the queue is busy right now, try again in a bit!"))
+            return
+
+        # Spotify is contacted after the channel is released, so reserve
+        # the cooldown now to keep the user from queueing twice meanwhile
+        previous_cooldown = user.time_cooldown
+        queue_cooldown = integration.queue_cooldown_subscriber if is_subscriber else integration.queue_cooldown
+        user.time_cooldown = timezone.now() + timezone.timedelta(seconds=queue_cooldown)
+        moderation.set_cooldown(context.channel.name, user.pk, user.name, user.time_cooldown, user.manual_cooldown)
+
         track_url, track_id = match
+        later(self.admission.run(
+            ticket,
+            handle_errors(context, self.queue_track(context, integration, user, track_id, previous_cooldown))))
+
+    async def queue_track(
+            self,
+            context: Context,
+            integration: IntegrationSnapshot,
+            user: TwitchIntegrationUser,
+            track_id: str,
+            previous_cooldown: Optional[timezone.datetime]):
+        """Talk to Spotify on the event loop, then record the queue."""
+
+        spotify = integration.get_spotify()
         track_uri = f"spotify:track:{track_id}"
-        track_info = integration.user.spotify.get_track(track_id)
 
         added_to_playlist = False
         added_to_queue = False
 
-        if integration.add_to_queue:
-            integration.user.spotify.add_item_to_queue(track_uri)
-            added_to_queue = True
+        try:
+            track_info = await spotify.aget_track(track_id)
+
+            if integration.add_to_queue:
+                await spotify.aadd_item_to_queue(track_uri)
+                added_to_queue = True
 
-        if integration.add_to_playlist and integration.playlist_id is not None:
-            integration.user.spotify.add_items_to_playlist(integration.playlist_id, (track_uri,))
-            added_to_playlist = True
+            if integration.add_to_playlist and integration.playlist_id is not None:
+                await self.playlists.add(spotify, integration.playlist_id, track_uri)
+                added_to_playlist = True
 
-        later(context.send(f"{describe_queue_action(added_to_queue, added_to_playlist)} {describe_track(track_info)}"))
-        integration.queue_count += 1
-        user.queue_count += 1
-        integration.save()
+        except (UsageError, InternalError):
+            if not added_to_queue and not added_to_playlist:
+                moderation.release_cooldown(context.channel.name, user.pk, user.name, user.time_cooldown, previous_cooldown)
+            raise
 
-        queue_cooldown = integration.queue_cooldown_subscriber if is_subscriber else integration.queue_cooldown
-        user.time_cooldown = timezone.now() + timezone.timedelta(seconds=queue_cooldown)
-        user.save()
+        await context.reply(f"{describe_queue_action(added_to_queue, added_to_playlist)} {describe_track(track_info)}", merge=True)
+        if user.pk is None:
+            user = await self.executor.run(save_user, user)
+        writes.count_queue(integration.id, user.pk)
 
     @cooldown(rate=3, per=60)
-    @error_handling()
-    @with_integration()
-    def playlist(self, context: Context, later: Later, integration: TwitchIntegration):
+    @async_command()
+    @awith_snapshot()
+    async def playlist(self, context: Context, integration: IntegrationSnapshot):
         """Get the link to the playlist."""
 
         if integration.playlist_id is None:
-            later(context.reply("no playlist is configured for this channel"))
+            await context.reply("no playlist is configured for this channel")
             return
 
-        later(context.reply(get_playlist_url(integration.playlist_id)))
+        await context.reply(get_playlist_url(integration.playlist_id))
 
     @cooldown(rate=3, per=60)
-    @django_command()
-    @error_handling()
-    @with_integration(select_related=("user", "user__spotify"))
-    def song(self, context: Context, later: Later, integration: TwitchIntegration):
-        """Get the current song."""
+    @async_command()
+    @awith_snapshot()
+    async def song(self, context: Context, integration: IntegrationSnapshot):
+        """Get the current song, as last polled if the channel is followed."""
+
+        playback = self.nowplaying.get(context.channel.name)
+        if playback is None:
+            await handle_errors(context, self.reply_song(context, integration))
+        elif playback.track is None:
+            await context.reply(f"{integration.first_name} isn't listening to anything on Spotify!")
+        else:
+            await context.reply(describe_track(playback.track, include_url=True))
+
+    @staticmethod
+    async def reply_song(context: Context, integration: IntegrationSnapshot):
+        """Request the current song on the event loop."""
 
-        current_track = integration.user.spotify.get_current_track()
-        if current_track is None:
-            later(context.reply(f"{integration.user.first_name} isn't listening to anything on Spotify!"))
+        current = await integration.get_spotify().aget_current_track()
+        if current is None or current.track is None:
+            await context.reply(f"{integration.first_name} isn't listening to anything on Spotify!")
             return
 
-        later(context.reply(describe_track(current_track["item"], include_url=True)))
+        await context.reply(describe_track(current.track, include_url=True))
 
-    @django_command()
-    @with_integration()
-    @with_user()
-    def count(self, context: Context, later: Later, integration: TwitchIntegration, user: TwitchIntegrationUser):
+    @async_command()
+    @awith_snapshot()
+    async def count(self, context: Context, integration: IntegrationSnapshot):
         """Get the count of recommendations for a user."""
 
-        later(context.reply(
-            f"{user.name} has queued {user.queue_count} of {integration.queue_count} total songs"
-            f" on {context.channel.name}'s channel"))
+        user_count, queue_count = await self.executor.run(count_queues, integration.id, context.author.name)
+        await context.reply(
+            f"{context.author.name} has queued {user_count} of {queue_count} total songs"
+            f" on {context.channel.name}'s channel")
 
     @cooldown(rate=3, per=60)
-    @django_command()
-    @error_handling()
-    @with_integration(select_related=("user", "user__spotify"))
-    def recent(self, context: Context, later: Later, integration: TwitchIntegration):
-        """Get the last couple songs."""
+    @async_command()
+    @awith_snapshot()
+    async def recent(self, context: Context, integration: IntegrationSnapshot):
+        """Get the last couple songs, as last polled if the channel is followed."""
+
+        playback = self.nowplaying.get(context.channel.name)
+        if playback is None:
+            await handle_errors(context, self.reply_recent(context, integration))
+        elif not playback.recent:
+            await context.reply(f"{integration.first_name} isn't listening to anything on Spotify!")
+        else:
+            await context.reply(", ".join(describe_track(track, include_url=True) for track in playback.recent))
 
-        recent_tracks = integration.user.spotify.get_recently_played(limit=3)
-        if recent_tracks is None:
-            later(context.reply(f"{integration.user.first_name} isn't listening to anything on Spotify!"))
-            return
+    @staticmethod
+    async def reply_recent(context: Context, integration: IntegrationSnapshot):
+        """Request recently played songs on the event loop."""
 
-        names = []
-        for item in recent_tracks["items"]:
-            if "track" in item:
-                names.append(describe_track(item["track"], include_url=True))
+        recent_tracks = await integration.get_spotify().aget_recently_played(limit=3)
+        if not recent_tracks:
+            await context.reply(f"{integration.first_name} isn't listening to anything on Spotify!")
+            return
 
-        later(context.reply(", ".join(names)))
+        await context.reply(", ".join(describe_track(track, include_url=True) for track in recent_tracks))
 
     @django_command(mods_only=True)
     @with_integration()
-    @with_user()
-    def ban(self, context: Context, later: Later, _: TwitchIntegration, user: TwitchIntegrationUser):
+    def ban(self, context: Context, later: Later, integration: TwitchIntegration):
         """Ban a user from queueing songs."""
 
-        if user.banned:
-            later(context.reply(f"{user.name} is already banned!"))
+        name = context.author.name
+        if moderation.is_banned(context.channel.name, name):
+            later(context.reply(f"{name} is already banned!"))
             return
 
-        user.banned = True
-        user.save()
-        later(context.reply(f"banned {user.name}"))
+        user, _ = TwitchIntegrationUser.objects.get_or_create_named(integration.id, name)
+        moderation.set_banned(context.channel.name, user.pk, name, True)
+        later(context.reply(f"banned {name}"))
 
     @django_command(mods_only=True)
     @with_integration()
-    @with_user()
-    def unban(self, context: Context, later: Later, _: TwitchIntegration, user: TwitchIntegrationUser):
-        """Ban a user from queueing songs."""
+    def unban(self, context: Context, later: Later, integration: TwitchIntegration):
+        """Unban a user from queueing songs."""
 
-        if not user.banned:
-            later(context.reply(f"{user.name} isn't banned!"))
+        name = context.author.name
+        if not moderation.is_banned(context.channel.name, name):
+            later(context.reply(f"{name} isn't banned!"))
             return
 
-        user.banned = False
-        user.save()
-        later(context.reply(f"unbanned {user.name}"))
+        user, _ = TwitchIntegrationUser.objects.get_or_create_named(integration.id, name)
+        moderation.set_banned(context.channel.name, user.pk, name, False)
+        later(context.reply(f"unbanned {name}"))
 
     @django_command(mods_only=True)
     @with_integration()
@@ -534,16 +972,18 @@ class TwitchBot(Bot):
             later(context.reply(f"expected a username!"))
             return
 
-        name = parts[1].strip()
-        user = integration.users.filter(name=name).first()
+        name = parse_name(parts[1])
+        user = integration.users.named(name).first()
         if user is None:
             later(context.reply(f"couldn't find user {name}"))
             return
 
+        cooldown = moderation.get_cooldown(context.channel.name, name)
+        manual_cooldown = cooldown is not None and cooldown[1]
         if len(parts) == 2:
-            if user.time_cooldown is not None and user.time_cooldown > timezone.now():
-                difference = user.time_cooldown - timezone.now()
-                manual = " manual" if user.manual_cooldown else ""
+            if cooldown is not None:
+                difference = cooldown[0] - timezone.now()
+                manual = " manual" if manual_cooldown else ""
                 later(context.reply(f"{name} has a{manual} cooldown for {ceil(difference.seconds)} more seconds"))
             else:
                 later(context.reply(f"{name} has no cooldown"))
@@ -555,13 +995,15 @@ class TwitchBot(Bot):
                 return
 
             if queue_cooldown <= 0:
-                user.time_cooldown = None
                 later(context.reply(f"{name}'s cooldown has been cleared"))
+                if cooldown is None:
+                    return
+                time_cooldown = None
             else:
-                user.time_cooldown = timezone.now() + timezone.timedelta(seconds=queue_cooldown)
+                time_cooldown = timezone.now() + timezone.timedelta(seconds=queue_cooldown)
                 later(context.reply(f"{name} is on a {ceil(queue_cooldown)} second cooldown"))
 
-            user.save()
+            moderation.set_cooldown(context.channel.name, user.pk, name, time_cooldown, manual_cooldown)
 
     @django_command(mods_only=True)
     @with_integration()
@@ -577,6 +1019,8 @@ class TwitchBot(Bot):
             "cooldown": self.config_cooldown,
             # "followcooldown": self.config_followcooldown,
             "subcooldown": self.config_subcooldown,
+            "backlog": self.config_backlog,
+            "maxwait": self.config_maxwait,
             "playlist": self.config_playlist}
 
         if len(parts) == 1:
@@ -669,6 +1113,36 @@ class TwitchBot(Bot):
 
         later(context.reply(f"subscriber queue cooldown is {integration.queue_cooldown_subscriber} seconds"))
 
+    @staticmethod
+    def config_backlog(context: Context, later: Later, integration: TwitchIntegration, value: str = None):
+        """Request or configure how many queues may be waiting on Spotify."""
+
+        if value is not None:
+            queue_backlog = try_int(value)
+            if queue_backlog is None or queue_backlog < 1:
+                later(context.reply("expected a positive whole number for backlog!"))
+                return
+
+            integration.queue_backlog = queue_backlog
+            integration.save()
+
+        later(context.reply(f"at most {integration.queue_backlog} songs can be waiting to queue"))
+
+    @staticmethod
+    def config_maxwait(context: Context, later: Later, integration: TwitchIntegration, value: str = None):
+        """Request or configure the longest expected wait before refusing queues."""
+
+        if value is not None:
+            queue_wait = try_float(value)
+            if queue_wait is None or queue_wait < 0:
+                later(context.reply(f"expected numeric value for max wait!"))
+                return
+
+            integration.queue_wait = queue_wait
+            integration.save()
+
+        later(context.reply(f"queueing is refused when the wait would be over {integration.queue_wait} seconds"))
+
     @staticmethod
     def config_usequeue(context: Context, later: Later, integration: TwitchIntegration, value: str = None):
         """Toggle queueing."""
@@ -727,8 +1201,7 @@ class TwitchBot(Bot):
             later(context.reply("failed to verify playlist, please check Spotify authorization!"))
             return
 
-        playlist_name = playlist["name"]
-        later(context.reply(f"set playlist to {playlist_name} {playlist_url}"))
+        later(context.reply(f"set playlist to {playlist.name} {playlist_url}"))
         return
 
     @django_command(mods_only=True)
@@ -765,6 +1238,38 @@ class Command(BaseCommand):
         """Configuration options."""
 
         parser.add_argument("--debug", dest="debug", action="store_true", default=False)
+        parser.add_argument(
+            "--workers",
+            dest="workers",
+            type=int,
+            default=4,
+            help="threads for database work; channels are processed in parallel up to this many")
+        parser.add_argument(
+            "--playlist-window",
+            dest="playlist_window",
+            type=float,
+            default=0.5,
+            help="seconds to collect tracks for the same playlist into one request")
+        parser.add_argument(
+            "--shard",
+            dest="shard",
+            type=int,
+            help="index of this process when running several, from 0 to --shards - 1")
+        parser.add_argument(
+            "--shards",
+            dest="shards",
+            type=int,
+            help="number of processes channels are divided between")
+        parser.add_argument(
+            "--eventsub-callback",
+            dest="eventsub_callback",
+            help="public URL Twitch sends stream events to; polling is only used to reconcile when set")
+        parser.add_argument(
+            "--eventsub-port",
+            dest="eventsub_port",
+            type=int,
+            default=8080,
+            help="local port to receive stream events on")
 
     def handle(self, *args, **options):
         """Run the Twitch bot."""
@@ -774,5 +1279,26 @@ class Command(BaseCommand):
         else:
             logger.setLevel(logging.INFO)
 
-        bot = TwitchBot()
+        if options["eventsub_callback"] is not None and not settings.TWITCH_EVENTSUB_SECRET:
+            raise CommandError("TWITCH_EVENTSUB_SECRET must be set to use EventSub")
+
+        shard = None
+        if options["shard"] is not None or options["shards"] is not None:
+            if options["shard"] is None or options["shards"] is None:
+                raise CommandError("--shard and --shards must be passed together")
+            if not 0 <= options["shard"] < options["shards"]:
+                raise CommandError("--shard must be between 0 and --shards - 1")
+
+            shard = ShardMembership(options["shard"], options["shards"])
+            try:
+                shard.claim()
+            except InternalError as error:
+                raise CommandError(str(error))
+
+        bot = TwitchBot(
+            workers=options["workers"],
+            playlist_window=options["playlist_window"],
+            shard=shard,
+            eventsub_callback=options["eventsub_callback"],
+            eventsub_port=options["eventsub_port"])
         bot.run()
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.3 on 2026-10-17 01:46
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_alter_twitchintegration_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TwitchShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField(unique=True)),
+                ('shards', models.PositiveIntegerField()),
+                ('host', models.CharField(max_length=200)),
+                ('time_created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('time_heartbeat', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
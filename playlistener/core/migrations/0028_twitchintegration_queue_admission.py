@@ -0,0 +1,23 @@
+# Generated by Django 4.1.3 on 2026-10-17 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_twitchshard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='twitchintegration',
+            name='queue_backlog',
+            field=models.PositiveIntegerField(default=20),
+        ),
+        migrations.AddField(
+            model_name='twitchintegration',
+            name='queue_wait',
+            field=models.FloatField(default=30),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+def merge_names(apps, schema_editor):
+    """Merge users whose names only differ by case and lowercase the rest.
+
+    The oldest row is kept with the sum of the queue counts, a ban if
+    any row was banned and the latest cooldown.
+    """
+
+    TwitchIntegrationUser = apps.get_model("core", "TwitchIntegrationUser")
+
+    groups = {}
+    for user in TwitchIntegrationUser.objects.order_by("time_created", "pk").iterator():
+        groups.setdefault((user.integration_id, user.name.lower()), []).append(user)
+
+    for (_, name), users in groups.items():
+        kept, *duplicates = users
+        if not duplicates and kept.name == name:
+            continue
+
+        kept.name = name
+        for duplicate in duplicates:
+            kept.banned = kept.banned or duplicate.banned
+            kept.queue_count += duplicate.queue_count
+            if duplicate.time_cooldown is not None and (kept.time_cooldown is None or duplicate.time_cooldown > kept.time_cooldown):
+                kept.time_cooldown = duplicate.time_cooldown
+                kept.manual_cooldown = duplicate.manual_cooldown
+
+        TwitchIntegrationUser.objects.filter(pk__in=[duplicate.pk for duplicate in duplicates]).delete()
+        kept.save(update_fields=("name", "banned", "queue_count", "time_cooldown", "manual_cooldown"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_twitchintegration_queue_admission'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.1.3 on 2026-10-17 02:04
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_merge_twitchintegrationuser_names'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='twitchintegrationuser',
+            index=models.Index(condition=models.Q(('banned', True)), fields=['integration'], name='integration_user_banned'),
+        ),
+        migrations.AddIndex(
+            model_name='twitchintegrationuser',
+            index=models.Index(fields=['integration', 'time_cooldown'], name='integration_user_cooldown'),
+        ),
+        migrations.AddConstraint(
+            model_name='twitchintegrationuser',
+            constraint=models.UniqueConstraint(models.F('integration'), django.db.models.functions.text.Lower('name'), name='unique_integration_user_name'),
+        ),
+    ]
@@ -1,16 +1,25 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.conf import settings
 from django.http.request import HttpRequest
-from django.db.models import Q
+from django.db.models import F, Q
+from django.db.models.functions import Lower
 
+import httpx
 import requests
+import asyncio
 import base64
-from typing import Iterable, Optional
+import logging
+from typing import Any, Callable, Iterable, Optional, Tuple
 
 from common.oauth import OAuthAuthorization, get_view_url
-from common.errors import UsageError, InternalError
+from common.errors import UsageError, InternalError, UnavailableError
+from common.http import TIMEOUT_SECONDS, CircuitBreaker, get_client, get_async_client, get_timeout
+from common.spotify import PLAYLIST_FIELDS, Account, CurrentlyPlaying, Playlist, Track, parse_recently_played
+from common.tracks import tracks
+from common.limits import RequestScheduler
+from common.cache import NOT_MODIFIED, ReadCache
 
 __all__ = (
     "User",
@@ -18,7 +27,58 @@ __all__ = (
     "SpotifyAuthorization",
     "TwitchAuthorization",
     "TwitchIntegration",
-    "TwitchIntegrationUser",)
+    "TwitchIntegrationUser",
+    "TwitchShard",)
+
+
+SPOTIFY_API_URL = "https://api.spotify.com/v1"
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+SPOTIFY_THROTTLE_ATTEMPTS = 5
+
+logger = logging.getLogger(__name__)
+
+# Spotify limits the whole app by client ID over a rolling window; the
+# per-account bucket keeps one busy channel from using all of it
+spotify_requests = RequestScheduler(rate=10, capacity=30, key_rate=3, key_capacity=10)
+spotify_circuits = CircuitBreaker()
+
+# Seconds reads stay fresh per endpoint; writes invalidate what they change
+spotify_reads = ReadCache(size=2000, ttls={
+    "me": 300,
+    "playlist": 60,
+    "current_track": 5,
+    "recently_played": 15})
+
+SPOTIFY_UNAVAILABLE_MESSAGE = "sorry, Spotify isn't responding right now, try again in a bit!"
+SPOTIFY_BUSY_MESSAGE = "sorry, Spotify is busy right now, try again in a bit!"
+
+
+def get_retry_after(response: httpx.Response) -> float:
+    """Read Retry-After in seconds, defaulting to one second."""
+
+    try:
+        return max(float(response.headers.get("Retry-After", 1)), 0)
+    except ValueError:
+        return 1
+
+
+def throttled(response: httpx.Response):
+    """Hold every request for as long as a 429 asks.
+
+    Spotify rate limits by client ID rather than by user, so a 429 on
+    any account means the whole app is over its budget. Throttles don't
+    count against an account's circuit.
+    """
+
+    retry_after = get_retry_after(response)
+    logger.warning("throttled by Spotify for %s seconds", retry_after)
+    spotify_requests.pause(retry_after)
+
+
+def make_conditional_headers(etag: Optional[str]) -> dict:
+    """Ask Spotify for a 304 if what we have is current."""
+
+    return {"If-None-Match": etag} if etag is not None else {}
 
 
 class Invitation(models.Model):
@@ -31,7 +91,13 @@ class Invitation(models.Model):
 
 
 class SpotifyAuthorization(OAuthAuthorization):
-    """Contains API keys for Spotify use."""
+    """Contains API keys for Spotify use.
+
+    Every endpoint has a synchronous method for the web views and an
+    asynchronous, a-prefixed counterpart for the bot. Both share the
+    process-wide keep-alive clients in common.http and differ only in
+    how the request is sent; response handling is common.
+    """
 
     user = models.OneToOneField(to=User, on_delete=models.CASCADE, related_name="spotify")
 
@@ -41,41 +107,60 @@ class SpotifyAuthorization(OAuthAuthorization):
     def authorize(self, request: HttpRequest, code: str):
         """Create a Spotify authorization with an OAuth code."""
 
-        headers = {
-            "Authorization": f"Basic {self.CLIENT_TOKEN}",
-            "Content-Type": "application/x-www-form-urlencoded"}
         data = {
             "code": code,
             "grant_type": "authorization_code",
             "redirect_uri": get_view_url(request, "core:oauth_spotify_receive")}
 
-        self.time_refreshed = timezone.now()
-        response = requests.post(
-            "https://accounts.spotify.com/api/token",
-            headers=headers,
-            data=data)
-
-        self.update(response)
+        self.update(self.post_token(data))
+        spotify_reads.invalidate(self.user_id)
 
     def refresh(self):
         """Refresh the Spotify authorization token."""
 
-        headers = {
-            "Authorization": f"Basic {self.CLIENT_TOKEN}",
-            "Content-Type": "application/x-www-form-urlencoded"}
-        data = {
-            "grant_type": "refresh_token",
-            "refresh_token": self.refresh_token}
-
-        self.time_refreshed = timezone.now()
-        response = requests.post(
-            "https://accounts.spotify.com/api/token",
-            headers=headers,
-            data=data)
-
-        self.update(response)
-
-    def update(self, response: requests.Response):
+        self.update(self.post_token(self.make_refresh_data()))
+
+    async def arefresh(self):
+        """Refresh the Spotify authorization token on the event loop."""
+
+        self.update(await self.apost_token(self.make_refresh_data()))
+
+    def post_token(self, data: dict) -> httpx.Response:
+        """Request a token within the current deadline, like any API request."""
+
+        spotify_circuits.check(self.user_id, SPOTIFY_UNAVAILABLE_MESSAGE)
+        try:
+            response = get_client().post(
+                SPOTIFY_TOKEN_URL,
+                headers=self.make_token_headers(),
+                data=data,
+                timeout=get_timeout())
+        except httpx.TransportError as error:
+            spotify_circuits.failure(self.user_id)
+            raise UnavailableError(SPOTIFY_UNAVAILABLE_MESSAGE, details=repr(error))
+
+        self.record_outcome(response)
+        return response
+
+    async def apost_token(self, data: dict) -> httpx.Response:
+        """Asynchronous version of post_token."""
+
+        spotify_circuits.check(self.user_id, SPOTIFY_UNAVAILABLE_MESSAGE)
+        timeout = get_timeout()
+        try:
+            response = await asyncio.wait_for(get_async_client().post(
+                SPOTIFY_TOKEN_URL,
+                headers=self.make_token_headers(),
+                data=data,
+                timeout=timeout), timeout=timeout)
+        except (asyncio.TimeoutError, httpx.TransportError) as error:
+            spotify_circuits.failure(self.user_id)
+            raise UnavailableError(SPOTIFY_UNAVAILABLE_MESSAGE, details=repr(error))
+
+        self.record_outcome(response)
+        return response
+
+    def update(self, response: httpx.Response):
         """Update data based on authorization response."""
 
         if response.status_code != 200:
@@ -89,6 +174,21 @@ class SpotifyAuthorization(OAuthAuthorization):
         self.token_type = data["token_type"]
         self.expires_in = data["expires_in"]
         self.scope = data["scope"]
+        self.time_refreshed = timezone.now()
+
+    def make_token_headers(self) -> dict:
+        """Client credentials for the accounts service."""
+
+        return {
+            "Authorization": f"Basic {self.CLIENT_TOKEN}",
+            "Content-Type": "application/x-www-form-urlencoded"}
+
+    def make_refresh_data(self) -> dict:
+        """Form data for a refresh token grant."""
+
+        return {
+            "grant_type": "refresh_token",
+            "refresh_token": self.refresh_token}
 
     def make_headers(self, **extra) -> dict:
         """Reuse."""
@@ -98,26 +198,168 @@ class SpotifyAuthorization(OAuthAuthorization):
             "Content-Type": "application/json",
             **extra}
 
-    def get_me(self) -> dict:
+    def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send an authorized API request over the shared client."""
+
+        return self.retry(lambda: self.send(method, path, **kwargs))
+
+    async def arequest(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send an authorized API request over the event loop's client."""
+
+        return await self.aretry(lambda: self.asend(method, path, **kwargs))
+
+    def send(self, method: str, path: str, headers: Optional[dict] = None, **kwargs) -> httpx.Response:
+        """Wait for the scheduler, retrying when Spotify throttles us.
+
+        Requests share the deadline of the current context, failing
+        rather than waiting past it for a turn, and accounts whose
+        requests keep failing are refused until their circuit closes.
+        """
+
+        spotify_circuits.check(self.user_id, SPOTIFY_UNAVAILABLE_MESSAGE)
+        for _ in range(SPOTIFY_THROTTLE_ATTEMPTS):
+            if not spotify_requests.wait(self.user_id, get_timeout()):
+                raise UnavailableError(SPOTIFY_BUSY_MESSAGE)
+
+            try:
+                response = get_client().request(
+                    method,
+                    f"{SPOTIFY_API_URL}{path}",
+                    headers=self.make_headers(**(headers or {})),
+                    timeout=get_timeout(),
+                    **kwargs)
+            except httpx.TransportError as error:
+                spotify_circuits.failure(self.user_id)
+                raise UnavailableError(SPOTIFY_UNAVAILABLE_MESSAGE, details=repr(error))
+
+            if response.status_code != 429:
+                break
+
+            throttled(response)
+        else:
+            raise UnavailableError(SPOTIFY_BUSY_MESSAGE, details=f"throttled {SPOTIFY_THROTTLE_ATTEMPTS} times")
+
+        self.record_outcome(response)
+        return response
+
+    async def asend(self, method: str, path: str, headers: Optional[dict] = None, **kwargs) -> httpx.Response:
+        """Asynchronous version of send."""
+
+        spotify_circuits.check(self.user_id, SPOTIFY_UNAVAILABLE_MESSAGE)
+        for _ in range(SPOTIFY_THROTTLE_ATTEMPTS):
+            if not await spotify_requests.await_turn(self.user_id, get_timeout()):
+                raise UnavailableError(SPOTIFY_BUSY_MESSAGE)
+
+            # httpx timeouts apply per read, so bound the whole exchange
+            timeout = get_timeout()
+            try:
+                response = await asyncio.wait_for(get_async_client().request(
+                    method,
+                    f"{SPOTIFY_API_URL}{path}",
+                    headers=self.make_headers(**(headers or {})),
+                    timeout=timeout,
+                    **kwargs), timeout=timeout)
+            except (asyncio.TimeoutError, httpx.TransportError) as error:
+                spotify_circuits.failure(self.user_id)
+                raise UnavailableError(SPOTIFY_UNAVAILABLE_MESSAGE, details=repr(error))
+
+            if response.status_code != 429:
+                break
+
+            throttled(response)
+        else:
+            raise UnavailableError(SPOTIFY_BUSY_MESSAGE, details=f"throttled {SPOTIFY_THROTTLE_ATTEMPTS} times")
+
+        self.record_outcome(response)
+        return response
+
+    def record_outcome(self, response: httpx.Response):
+        """Server errors count against the account's circuit."""
+
+        if response.status_code >= 500:
+            spotify_circuits.failure(self.user_id)
+        else:
+            spotify_circuits.success(self.user_id)
+
+    def read(self, endpoint: str, args: Tuple, path: str, handle: Callable[[httpx.Response], Any], **kwargs) -> Any:
+        """GET through the read cache, revalidating expired reads by ETag."""
+
+        def fetch(etag: Optional[str]) -> Tuple[Any, Optional[str]]:
+            response = self.request("GET", path, headers=make_conditional_headers(etag), **kwargs)
+            if response.status_code == 304:
+                return NOT_MODIFIED, etag
+            return handle(response), response.headers.get("ETag")
+
+        return spotify_reads.get(endpoint, self.user_id, args, fetch)
+
+    async def aread(
+            self,
+            endpoint: str,
+            args: Tuple,
+            path: str,
+            handle: Callable[[httpx.Response], Any],
+            **kwargs) -> Any:
+        """Asynchronous version of read."""
+
+        async def fetch(etag: Optional[str]) -> Tuple[Any, Optional[str]]:
+            response = await self.arequest("GET", path, headers=make_conditional_headers(etag), **kwargs)
+            if response.status_code == 304:
+                return NOT_MODIFIED, etag
+            return handle(response), response.headers.get("ETag")
+
+        return await spotify_reads.aget(endpoint, self.user_id, args, fetch)
+
+    def get_me(self) -> Account:
         """Get user info."""
 
-        response = self.retry(lambda: requests.get(
-            "https://api.spotify.com/v1/me",
-            headers=self.make_headers()))
+        return self.read("me", (), "/me", self.handle_me)
+
+    async def aget_me(self) -> Account:
+        """Get user info."""
+
+        return await self.aread("me", (), "/me", self.handle_me)
+
+    @staticmethod
+    def handle_me(response: httpx.Response) -> Account:
+        """Check the user response."""
 
         if response.status_code != 200:
             raise InternalError(
                 "failed to access authorized user's data",
                 details=f"status {response.status_code}; {response.content}")
 
-        return response.json()
-
-    def get_track(self, track_id: str) -> dict:
-        """Get track info."""
-
-        response = self.retry(lambda: requests.get(
-            f"https://api.spotify.com/v1/tracks/{track_id}",
-            headers=self.make_headers()))
+        return Account.from_json(response.json())
+
+    def get_track(self, track_id: str) -> Track:
+        """Get track info, preferring the shared track cache."""
+
+        track, etag, fresh = tracks.get(track_id)
+        if not fresh:
+            response = self.request("GET", f"/tracks/{track_id}", headers=make_conditional_headers(etag))
+            revalidated = response.status_code == 304 and track is not None
+            if not revalidated:
+                track, etag = self.handle_track(track_id, response), response.headers.get("ETag")
+            tracks.put(track, etag, revalidated)
+        return track
+
+    async def aget_track(self, track_id: str) -> Track:
+        """Get track info, preferring the shared track cache."""
+
+        track, etag, fresh = tracks.memory.get(track_id), None, True
+        if track is None:
+            track, etag, fresh = await asyncio.to_thread(tracks.load, track_id)
+        if not fresh:
+            response = await self.arequest("GET", f"/tracks/{track_id}", headers=make_conditional_headers(etag))
+            revalidated = response.status_code == 304 and track is not None
+            if not revalidated:
+                track, etag = self.handle_track(track_id, response), response.headers.get("ETag")
+            tracks.memory.put(track.id, track)
+            await asyncio.to_thread(tracks.store, track, etag, revalidated)
+        return track
+
+    @staticmethod
+    def handle_track(track_id: str, response: httpx.Response) -> Track:
+        """Check the track response."""
 
         if response.status_code == 400:
             raise UsageError("sorry, this track doesn't seem to exist!")
@@ -126,14 +368,21 @@ class SpotifyAuthorization(OAuthAuthorization):
                 f"failed to retrieve track ID {track_id}",
                 details=f"status {response.status_code}; {response.content}")
 
-        return response.json()
+        return Track.from_json(response.json())
 
-    def get_current_track(self) -> Optional[dict]:
+    def get_current_track(self) -> Optional[CurrentlyPlaying]:
         """Get the currently playing track."""
 
-        response = self.retry(lambda: requests.get(
-            "https://api.spotify.com/v1/me/player/currently-playing",
-            headers=self.make_headers()))
+        return self.read("current_track", (), "/me/player/currently-playing", self.handle_current_track)
+
+    async def aget_current_track(self) -> Optional[CurrentlyPlaying]:
+        """Get the currently playing track."""
+
+        return await self.aread("current_track", (), "/me/player/currently-playing", self.handle_current_track)
+
+    @staticmethod
+    def handle_current_track(response: httpx.Response) -> Optional[CurrentlyPlaying]:
+        """Check the currently playing response."""
 
         if response.status_code == 204:
             return None
@@ -143,14 +392,31 @@ class SpotifyAuthorization(OAuthAuthorization):
                 f"failed to retrieve current track",
                 details=f"status {response.status_code}; {response.content}")
 
-        return response.json()
+        return CurrentlyPlaying.from_json(response.json())
 
-    def get_recently_played(self, limit: int = 3) -> Optional[dict]:
+    def get_recently_played(self, limit: int = 3) -> Optional[Tuple[Track, ...]]:
         """Get the recently played tracks of a user."""
 
-        response = self.retry(lambda: requests.get(
-            f"https://api.spotify.com/v1/me/player/recently-played?limit={limit}",
-            headers=self.make_headers()))
+        return self.read(
+            "recently_played",
+            (limit,),
+            "/me/player/recently-played",
+            self.handle_recently_played,
+            params={"limit": limit})
+
+    async def aget_recently_played(self, limit: int = 3) -> Optional[Tuple[Track, ...]]:
+        """Get the recently played tracks of a user."""
+
+        return await self.aread(
+            "recently_played",
+            (limit,),
+            "/me/player/recently-played",
+            self.handle_recently_played,
+            params={"limit": limit})
+
+    @staticmethod
+    def handle_recently_played(response: httpx.Response) -> Optional[Tuple[Track, ...]]:
+        """Check the recently played response."""
 
         if response.status_code == 204:
             return None
@@ -160,14 +426,31 @@ class SpotifyAuthorization(OAuthAuthorization):
                 f"failed to retrieve recently played tracks",
                 details=f"status {response.status_code}; {response.content}")
 
-        return response.json()
+        return parse_recently_played(response.json())
 
-    def get_playlist(self, playlist_id: str) -> dict:
-        """Get track info."""
+    def get_playlist(self, playlist_id: str) -> Playlist:
+        """Get playlist info, without its tracks."""
 
-        response = self.retry(lambda: requests.get(
-            f"https://api.spotify.com/v1/playlists/{playlist_id}",
-            headers=self.make_headers()))
+        return self.read(
+            "playlist",
+            (playlist_id,),
+            f"/playlists/{playlist_id}",
+            self.handle_playlist,
+            params={"fields": PLAYLIST_FIELDS})
+
+    async def aget_playlist(self, playlist_id: str) -> Playlist:
+        """Get playlist info, without its tracks."""
+
+        return await self.aread(
+            "playlist",
+            (playlist_id,),
+            f"/playlists/{playlist_id}",
+            self.handle_playlist,
+            params={"fields": PLAYLIST_FIELDS})
+
+    @staticmethod
+    def handle_playlist(response: httpx.Response) -> Playlist:
+        """Check the playlist response."""
 
         if response.status_code == 404:
             raise UsageError("sorry, this playlist doesn't seem to exist!")
@@ -177,15 +460,29 @@ class SpotifyAuthorization(OAuthAuthorization):
                 "failed to retrieve playlist",
                 details=f"status {response.status_code}; {response.content}")
 
-        return response.json()
+        return Playlist.from_json(response.json())
 
     def add_items_to_playlist(self, playlist_id: str, uris: Iterable[str]):
         """Add a series of tracks to a playlist."""
 
-        response = self.retry(lambda: requests.post(
-            f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
-            headers=self.make_headers(),
-            json={"uris": uris}))
+        self.handle_add_items_to_playlist(self.request(
+            "POST",
+            f"/playlists/{playlist_id}/tracks",
+            json={"uris": list(uris)}))
+        spotify_reads.invalidate(self.user_id, "playlist")
+
+    async def aadd_items_to_playlist(self, playlist_id: str, uris: Iterable[str]):
+        """Add a series of tracks to a playlist."""
+
+        self.handle_add_items_to_playlist(await self.arequest(
+            "POST",
+            f"/playlists/{playlist_id}/tracks",
+            json={"uris": list(uris)}))
+        spotify_reads.invalidate(self.user_id, "playlist")
+
+    @staticmethod
+    def handle_add_items_to_playlist(response: httpx.Response):
+        """Check the playlist addition response."""
 
         if response.status_code != 201:
             raise InternalError(
@@ -195,9 +492,15 @@ class SpotifyAuthorization(OAuthAuthorization):
     def add_item_to_queue(self, uri: str):
         """Add a track to a queue."""
 
-        response = self.retry(lambda: requests.post(
-            f"https://api.spotify.com/v1/me/player/queue?uri={uri}",
-            headers=self.make_headers()))
+        self.handle_add_item_to_queue(self.request("POST", "/me/player/queue", params={"uri": uri}))
+
+    async def aadd_item_to_queue(self, uri: str):
+        """Add a track to a queue."""
+
+        self.handle_add_item_to_queue(await self.arequest("POST", "/me/player/queue", params={"uri": uri}))
+
+    def handle_add_item_to_queue(self, response: httpx.Response):
+        """Check the queue response."""
 
         if response.status_code == 404:
             if response.headers.get("Content-Type") == "application/json":
@@ -230,11 +533,11 @@ class TwitchAuthorization(OAuthAuthorization):
             "client_secret": settings.TWITCH_CLIENT_SECRET,
             "redirect_uri": get_view_url(request, "core:oauth_twitch_receive")}
 
-        self.time_refreshed = timezone.now()
         response = requests.post(
             "https://id.twitch.tv/oauth2/token",
             headers=headers,
-            data=data)
+            data=data,
+            timeout=TIMEOUT_SECONDS)
 
         self.update(response)
 
@@ -249,11 +552,11 @@ class TwitchAuthorization(OAuthAuthorization):
             "grant_type": "refresh_token",
             "refresh_token": self.refresh_token}
 
-        self.time_refreshed = timezone.now()
         response = requests.post(
             "https://id.twitch.tv/oauth2/token",
             headers=headers,
-            data=data)
+            data=data,
+            timeout=TIMEOUT_SECONDS)
 
         self.update(response)
 
@@ -271,7 +574,7 @@ class TwitchAuthorization(OAuthAuthorization):
         self.token_type = data["token_type"]
         self.expires_in = data["expires_in"]
         self.scope = " ".join(data.get("scope", ()))
-        self.save()
+        self.time_refreshed = timezone.now()
 
     def make_headers(self, **extra) -> dict:
         """Reuse."""
@@ -287,7 +590,8 @@ class TwitchAuthorization(OAuthAuthorization):
 
         response = self.retry(lambda: requests.get(
             "https://api.twitch.tv/helix/users",
-            headers=self.make_headers()))
+            headers=self.make_headers(),
+            timeout=TIMEOUT_SECONDS))
 
         if response.status_code != 200:
             raise InternalError(
@@ -322,6 +626,8 @@ class TwitchIntegration(Integration):
     queue_cooldown_follower = models.FloatField(default=60)
     queue_cooldown_subscriber = models.FloatField(default=15)
     queue_count = models.PositiveIntegerField(default=0)
+    queue_backlog = models.PositiveIntegerField(default=20)
+    queue_wait = models.FloatField(default=30)
 
     followers_only = models.BooleanField(default=True)
     subscribers_only = models.BooleanField(default=False)
@@ -338,8 +644,34 @@ class TwitchIntegration(Integration):
         ]
 
 
+class TwitchIntegrationUserQuerySet(models.QuerySet):
+    """Lookups by name that match the case-insensitive unique index."""
+
+    def named(self, name: str) -> "TwitchIntegrationUserQuerySet":
+        """Filter by name, ignoring case."""
+
+        return self.alias(name_lower=Lower("name")).filter(name_lower=name.lower())
+
+    def get_or_create_named(self, integration_id: int, name: str, **defaults) -> Tuple["TwitchIntegrationUser", bool]:
+        """Same as get_or_create but by name, ignoring case."""
+
+        user = self.filter(integration_id=integration_id).named(name).first()
+        if user is not None:
+            return user, False
+
+        try:
+            with transaction.atomic():
+                return self.create(integration_id=integration_id, name=name.lower(), **defaults), True
+        except IntegrityError:
+            return self.filter(integration_id=integration_id).named(name).get(), False
+
+
 class TwitchIntegrationUser(models.Model):
-    """Used for bans and timeouts."""
+    """Used for bans and timeouts.
+
+    Names are stored lowercase, like Twitch logins, and are unique per
+    integration regardless of case.
+    """
 
     integration = models.ForeignKey(to=TwitchIntegration, on_delete=models.CASCADE, related_name="users")
 
@@ -351,3 +683,25 @@ class TwitchIntegrationUser(models.Model):
     manual_cooldown = models.BooleanField(default=False)
 
     queue_count = models.PositiveIntegerField(default=0)
+
+    objects = TwitchIntegrationUserQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(F("integration"), Lower("name"), name="unique_integration_user_name")
+        ]
+        indexes = [
+            models.Index(fields=("integration",), condition=Q(banned=True), name="integration_user_banned"),
+            models.Index(fields=("integration", "time_cooldown"), name="integration_user_cooldown"),
+        ]
+
+
+class TwitchShard(models.Model):
+    """A running Twitch bot process and the shard it has claimed."""
+
+    index = models.PositiveIntegerField(unique=True)
+    shards = models.PositiveIntegerField()
+    host = models.CharField(max_length=200)
+
+    time_created = models.DateTimeField(default=timezone.now)
+    time_heartbeat = models.DateTimeField(default=timezone.now)
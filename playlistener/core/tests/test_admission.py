@@ -0,0 +1,98 @@
+from django.test import SimpleTestCase
+
+import asyncio
+
+from core.bot.admission import (
+    AdmissionController,
+    PRIORITY_BROADCASTER,
+    PRIORITY_MODERATOR,
+    PRIORITY_SUBSCRIBER,
+    PRIORITY_VIEWER)
+
+
+class AdmissionTests(SimpleTestCase):
+    """Admission and ordering of one channel's requests."""
+
+    def setUp(self):
+        """One request at a time, each expected to take a second."""
+
+        self.admission = AdmissionController(concurrency=1, service=1.0)
+
+    def test_backlog_full(self):
+        """Requests past the backlog are turned away, except the broadcaster's."""
+
+        for _ in range(2):
+            self.assertIsNotNone(self.admission.admit("channel", PRIORITY_VIEWER, 2, 60))
+        self.assertIsNone(self.admission.admit("channel", PRIORITY_VIEWER, 2, 60))
+        self.assertIsNone(self.admission.admit("channel", PRIORITY_MODERATOR, 2, 60))
+        self.assertIsNotNone(self.admission.admit("channel", PRIORITY_BROADCASTER, 2, 60))
+        self.assertIsNotNone(self.admission.admit("other", PRIORITY_VIEWER, 2, 60))
+
+        stats = self.admission.stats()
+        self.assertEqual((stats["accepted"], stats["rejected"], stats["backlog"]), (4, 2, 4))
+
+    def test_wait_too_long(self):
+        """Requests are turned away if those ahead of them would take too long."""
+
+        for _ in range(2):
+            self.admission.admit("channel", PRIORITY_VIEWER, 10, 1.5)
+        self.assertIsNone(self.admission.admit("channel", PRIORITY_VIEWER, 10, 1.5))
+
+        # Viewers don't hold up a moderator
+        self.assertIsNotNone(self.admission.admit("channel", PRIORITY_MODERATOR, 10, 1.5))
+
+    def test_order(self):
+        """Waiting requests run by priority, then in arrival order."""
+
+        order = []
+
+        async def request(name):
+            order.append(name)
+            await asyncio.sleep(0)
+
+        async def main():
+            release = asyncio.Event()
+            holder = self.admission.admit("channel", PRIORITY_VIEWER, 10, 60)
+            held = asyncio.ensure_future(self.admission.run(holder, release.wait()))
+            await asyncio.sleep(0)
+
+            tasks = []
+            for name, priority in (
+                    ("viewer 1", PRIORITY_VIEWER),
+                    ("subscriber", PRIORITY_SUBSCRIBER),
+                    ("viewer 2", PRIORITY_VIEWER),
+                    ("broadcaster", PRIORITY_BROADCASTER),
+                    ("moderator", PRIORITY_MODERATOR)):
+                ticket = self.admission.admit("channel", priority, 10, 60)
+                tasks.append(asyncio.ensure_future(self.admission.run(ticket, request(name))))
+            await asyncio.sleep(0)
+
+            release.set()
+            await asyncio.gather(held, *tasks)
+
+        asyncio.run(main())
+        self.assertEqual(order, ["broadcaster", "moderator", "subscriber", "viewer 1", "viewer 2"])
+        self.assertEqual(self.admission.stats()["backlog"], 0)
+
+    def test_cancel_waiting(self):
+        """A request cancelled while waiting leaves the backlog."""
+
+        async def main():
+            release = asyncio.Event()
+            holder = self.admission.admit("channel", PRIORITY_VIEWER, 10, 60)
+            held = asyncio.ensure_future(self.admission.run(holder, release.wait()))
+            await asyncio.sleep(0)
+
+            ticket = self.admission.admit("channel", PRIORITY_VIEWER, 10, 60)
+            waiting = asyncio.ensure_future(self.admission.run(ticket, asyncio.sleep(0)))
+            await asyncio.sleep(0)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertEqual(self.admission.stats()["backlog"], 1)
+
+            release.set()
+            await held
+
+        asyncio.run(main())
+        self.assertEqual(self.admission.stats()["backlog"], 0)
@@ -0,0 +1,233 @@
+from django.test import SimpleTestCase
+
+import asyncio
+import threading
+from unittest import mock
+
+from common.cache import NOT_MODIFIED, LRUCache, ReadCache
+
+
+class Clock:
+    """Stands in for the cache's time module."""
+
+    def __init__(self):
+        """Start at zero."""
+
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        """Read the clock."""
+
+        return self.now
+
+
+class ClockTestCase(SimpleTestCase):
+    """Runs each test against a clock it controls."""
+
+    def setUp(self):
+        """Patch the cache's clock."""
+
+        self.clock = Clock()
+        patcher = mock.patch("common.cache.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class LRUCacheTests(ClockTestCase):
+    """Bounds and expiry of the LRU cache."""
+
+    def test_ttl(self):
+        """Entries read as missing once their TTL has passed."""
+
+        cache = LRUCache(10, ttl=5)
+        cache.put("default", 1)
+        cache.put("custom", 2, ttl=20)
+
+        self.clock.now = 4
+        self.assertEqual(cache.get("default"), 1)
+        self.clock.now = 6
+        self.assertIsNone(cache.get("default"))
+        self.assertEqual(cache.get("custom"), 2)
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 2, "misses": 1})
+
+    def test_eviction(self):
+        """The least recently used entry is evicted first."""
+
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_pop(self):
+        """Popped entries are gone."""
+
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        self.assertEqual(cache.pop("a"), 1)
+        self.assertIsNone(cache.pop("a"))
+        self.assertIsNone(cache.get("a"))
+
+
+class ReadCacheTests(ClockTestCase):
+    """Caching, revalidation and coalescing of API reads."""
+
+    def setUp(self):
+        """A cache with one short-lived endpoint."""
+
+        super().setUp()
+        self.cache = ReadCache(10, {"me": 10, "queue": 1})
+        self.fetches = []
+
+    def fetch(self, value, etag=None):
+        """Make a fetch that records the ETag it was sent."""
+
+        def fetch(sent):
+            self.fetches.append(sent)
+            return value, etag
+
+        return fetch
+
+    def test_ttl(self):
+        """Reads are fresh for their endpoint's TTL."""
+
+        self.assertEqual(self.cache.get("me", 1, (), self.fetch("a")), "a")
+        self.clock.now = 9
+        self.assertEqual(self.cache.get("me", 1, (), self.fetch("b")), "a")
+        self.clock.now = 11
+        self.assertEqual(self.cache.get("me", 1, (), self.fetch("c")), "c")
+
+        self.assertEqual(self.fetches, [None, None])
+        self.assertEqual(self.cache.stats()["me"], {"hits": 1, "misses": 2, "coalesced": 0, "revalidated": 0})
+
+    def test_keys(self):
+        """Accounts and arguments are cached separately."""
+
+        self.cache.get("me", 1, (), self.fetch("a"))
+        self.assertEqual(self.cache.get("me", 2, (), self.fetch("b")), "b")
+        self.assertEqual(self.cache.get("me", 1, ("x",), self.fetch("c")), "c")
+
+    def test_revalidate(self):
+        """Expired reads with an ETag are renewed when not modified."""
+
+        self.cache.get("me", 1, (), self.fetch("a", "v1"))
+        self.clock.now = 11
+        self.assertEqual(self.cache.get("me", 1, (), self.fetch(NOT_MODIFIED)), "a")
+        self.clock.now = 15
+        self.assertEqual(self.cache.get("me", 1, (), self.fetch("b")), "a")
+
+        self.assertEqual(self.fetches, [None, "v1"])
+        self.assertEqual(self.cache.stats()["me"]["revalidated"], 1)
+
+    def test_errors_not_cached(self):
+        """A failed fetch is tried again by the next read."""
+
+        def fail(etag):
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            self.cache.get("me", 1, (), fail)
+        self.assertEqual(self.cache.get("me", 1, (), self.fetch("a")), "a")
+
+    def test_invalidate(self):
+        """Invalidated reads are fetched again, for that account only."""
+
+        self.cache.get("me", 1, (), self.fetch("a"))
+        self.cache.get("me", 2, (), self.fetch("a"))
+        self.cache.invalidate(1, "me")
+
+        self.assertEqual(self.cache.get("me", 1, (), self.fetch("b")), "b")
+        self.assertEqual(self.cache.get("me", 2, (), self.fetch("b")), "a")
+
+    def test_single_flight(self):
+        """Threads missing the same read share one fetch."""
+
+        release = threading.Event()
+
+        def fetch(etag):
+            self.fetches.append(etag)
+            release.wait(5)
+            return "a", None
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get("me", 1, (), fetch)))
+            for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while self.cache.stats()["me"]["coalesced"] < 2:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["a"] * 3)
+        self.assertEqual(len(self.fetches), 1)
+
+    def test_single_flight_error(self):
+        """Threads waiting on a failed fetch get its error, which isn't cached."""
+
+        release = threading.Event()
+
+        def fail(etag):
+            release.wait(5)
+            raise ValueError("failed")
+
+        errors = []
+
+        def get():
+            try:
+                self.cache.get("me", 1, (), fail)
+            except ValueError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=get) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while self.cache.stats()["me"]["coalesced"] < 2:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(self.cache.get("me", 1, (), self.fetch("a")), "a")
+
+    def test_async_single_flight(self):
+        """Tasks missing the same read share one fetch."""
+
+        async def fetch(etag):
+            self.fetches.append(etag)
+            await asyncio.sleep(0)
+            return "a", None
+
+        async def main():
+            return await asyncio.gather(*(self.cache.aget("me", 1, (), fetch) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(main()), ["a"] * 3)
+        self.assertEqual(len(self.fetches), 1)
+        self.assertEqual(self.cache.stats()["me"]["coalesced"], 2)
+
+    def test_async_error_not_cached(self):
+        """Tasks sharing a failed fetch all get its error, which isn't cached."""
+
+        async def fail(etag):
+            await asyncio.sleep(0)
+            raise ValueError("failed")
+
+        async def refetch(etag):
+            return "a", None
+
+        async def main():
+            results = await asyncio.gather(
+                *(self.cache.aget("me", 1, (), fail) for _ in range(3)),
+                return_exceptions=True)
+            return results, await self.cache.aget("me", 1, (), refetch)
+
+        results, value = asyncio.run(main())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(value, "a")
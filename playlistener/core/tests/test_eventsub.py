@@ -0,0 +1,150 @@
+from django.test import SimpleTestCase
+
+import asyncio
+import json
+from aiohttp.test_utils import TestClient, TestServer
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from core.bot.eventsub import STREAM_OFFLINE, STREAM_ONLINE, EventSubReceiver, sign
+
+SECRET = "secret"
+
+
+def make_timestamp(age: timedelta = timedelta()) -> str:
+    """Format a timestamp the way Twitch does, with nanoseconds."""
+
+    return (datetime.now(timezone.utc) - age).strftime("%Y-%m-%dT%H:%M:%S.%f123Z")
+
+
+class EventSubTests(SimpleTestCase):
+    """Verification and dispatch of EventSub deliveries."""
+
+    def setUp(self):
+        """A receiver that records which channels it would join and part."""
+
+        self.events: List[Tuple[str, str]] = []
+
+        async def on_online(login: str):
+            self.events.append(("join", login))
+
+        async def on_offline(login: str):
+            self.events.append(("part", login))
+
+        self.receiver = EventSubReceiver(SECRET, "https://example.com/eventsub", on_online, on_offline)
+
+    def deliver(
+            self,
+            message_type: str,
+            payload: dict,
+            message_id: str = "message",
+            timestamp: Optional[str] = None,
+            secret: str = SECRET) -> Tuple[int, str]:
+        """Post a delivery, signed with secret, and return the status and body."""
+
+        return self.deliver_all([(message_type, payload, message_id, timestamp, secret)])[0]
+
+    def deliver_all(self, deliveries: list) -> List[Tuple[int, str]]:
+        """Post several deliveries to one server in order."""
+
+        async def main():
+            results = []
+            async with TestClient(TestServer(self.receiver.app)) as client:
+                for message_type, payload, message_id, timestamp, secret in deliveries:
+                    timestamp = timestamp or make_timestamp()
+                    body = json.dumps(payload).encode()
+                    response = await client.post("/eventsub", data=body, headers={
+                        "Twitch-Eventsub-Message-Id": message_id,
+                        "Twitch-Eventsub-Message-Type": message_type,
+                        "Twitch-Eventsub-Message-Timestamp": timestamp,
+                        "Twitch-Eventsub-Message-Signature": sign(secret, message_id, timestamp, body)})
+                    results.append((response.status, await response.text()))
+            return results
+
+        return asyncio.run(main())
+
+    @staticmethod
+    def stream(subscription_type: str, login: str) -> dict:
+        """A stream notification payload."""
+
+        return {
+            "subscription": {"type": subscription_type, "condition": {"broadcaster_user_id": "1"}},
+            "event": {"broadcaster_user_id": "1", "broadcaster_user_login": login}}
+
+    def test_online(self):
+        """A signed stream.online notification joins the channel."""
+
+        status, _ = self.deliver("notification", self.stream(STREAM_ONLINE, "streamer"))
+        self.assertEqual(status, 204)
+        self.assertEqual(self.events, [("join", "streamer")])
+
+    def test_offline(self):
+        """A signed stream.offline notification parts the channel."""
+
+        status, _ = self.deliver("notification", self.stream(STREAM_OFFLINE, "streamer"))
+        self.assertEqual(status, 204)
+        self.assertEqual(self.events, [("part", "streamer")])
+
+    def test_bad_signature(self):
+        """Deliveries signed with another secret are rejected."""
+
+        with self.assertLogs("core.bot.eventsub", "WARNING"):
+            status, _ = self.deliver("notification", self.stream(STREAM_ONLINE, "streamer"), secret="forged")
+        self.assertEqual(status, 403)
+        self.assertEqual(self.events, [])
+        self.assertEqual(self.receiver.stats()["rejected"], 1)
+
+    def test_missing_headers(self):
+        """Deliveries without Twitch's headers are rejected."""
+
+        async def main():
+            async with TestClient(TestServer(self.receiver.app)) as client:
+                response = await client.post("/eventsub", data=b"{}")
+                return response.status
+
+        self.assertEqual(asyncio.run(main()), 400)
+
+    def test_stale(self):
+        """Deliveries older than Twitch's retry window are rejected as replays."""
+
+        timestamp = make_timestamp(timedelta(minutes=11))
+        with self.assertLogs("core.bot.eventsub", "WARNING"):
+            status, _ = self.deliver("notification", self.stream(STREAM_ONLINE, "streamer"), timestamp=timestamp)
+        self.assertEqual(status, 403)
+        self.assertEqual(self.events, [])
+
+    def test_duplicate(self):
+        """A redelivered message is acknowledged but only dispatched once."""
+
+        delivery = ("notification", self.stream(STREAM_ONLINE, "streamer"), "message", None, SECRET)
+        other = ("notification", self.stream(STREAM_OFFLINE, "streamer"), "other", None, SECRET)
+        results = self.deliver_all([delivery, delivery, other])
+
+        self.assertEqual([status for status, _ in results], [204, 204, 204])
+        self.assertEqual(self.events, [("join", "streamer"), ("part", "streamer")])
+        self.assertEqual(self.receiver.stats()["duplicates"], 1)
+
+    def test_challenge(self):
+        """Subscription verification echoes the challenge without dispatching."""
+
+        status, text = self.deliver("webhook_callback_verification", {
+            "challenge": "pogchamp",
+            "subscription": {"id": "subscription", "type": STREAM_ONLINE}})
+        self.assertEqual((status, text), (200, "pogchamp"))
+        self.assertEqual(self.events, [])
+
+    def test_revocation(self):
+        """A revoked subscription is forgotten so reconcile recreates it."""
+
+        self.receiver.subscriptions[STREAM_ONLINE, "1"] = "subscription"
+        self.receiver.subscriptions[STREAM_OFFLINE, "1"] = "other"
+        with self.assertLogs("core.bot.eventsub", "WARNING"):
+            status, _ = self.deliver("revocation", {"subscription": {
+                "id": "subscription",
+                "type": STREAM_ONLINE,
+                "status": "authorization_revoked",
+                "condition": {"broadcaster_user_id": "1"}}})
+
+        self.assertEqual(status, 204)
+        self.assertEqual(self.receiver.subscriptions, {(STREAM_OFFLINE, "1"): "other"})
+        self.assertEqual(self.events, [])
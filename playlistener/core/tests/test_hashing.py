@@ -0,0 +1,53 @@
+from django.test import SimpleTestCase
+
+from common.hashing import HashRing, stable_hash
+
+
+class HashRingTests(SimpleTestCase):
+    """Assignment of channels to shards."""
+
+    keys = [f"channel{i}" for i in range(10000)]
+
+    def assign(self, ring: HashRing) -> dict:
+        """Map every key to its node."""
+
+        return {key: ring.get(key) for key in self.keys}
+
+    def test_stable_hash(self):
+        """Hashes don't depend on the process."""
+
+        self.assertEqual(stable_hash("channel"), 0xc485d2ed5cc4ce64)
+
+    def test_empty(self):
+        """A ring without nodes can't place keys."""
+
+        with self.assertRaises(LookupError):
+            HashRing([]).get("channel")
+
+    def test_balanced(self):
+        """Each node gets roughly its share of keys."""
+
+        assignment = self.assign(HashRing(range(4)))
+        for node in range(4):
+            share = sum(owner == node for owner in assignment.values()) / len(self.keys)
+            self.assertAlmostEqual(share, 1 / 4, delta=0.1)
+
+    def test_add_node(self):
+        """Adding a node only moves about its share of keys, all onto it."""
+
+        before = self.assign(HashRing(range(4)))
+        after = self.assign(HashRing(range(5)))
+        moved = [key for key in self.keys if before[key] != after[key]]
+
+        self.assertAlmostEqual(len(moved) / len(self.keys), 1 / 5, delta=0.1)
+        self.assertTrue(all(after[key] == 4 for key in moved))
+
+    def test_remove_node(self):
+        """Removing a node only moves the keys it owned."""
+
+        before = self.assign(HashRing(range(5)))
+        after = self.assign(HashRing([0, 1, 2, 4]))
+        moved = [key for key in self.keys if before[key] != after[key]]
+
+        self.assertAlmostEqual(len(moved) / len(self.keys), 1 / 5, delta=0.1)
+        self.assertTrue(all(before[key] == 3 for key in moved))
@@ -0,0 +1,46 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+import asyncio
+import httpx
+from unittest import mock
+
+from core.bot.integrations import load_snapshots
+from core.models import SpotifyAuthorization, TwitchIntegration
+from common.errors import UsageError
+
+
+def no_active_device(request: httpx.Request) -> httpx.Response:
+    """Spotify's answer to queueing while nothing is playing."""
+
+    return httpx.Response(404, json={"error": {"status": 404, "reason": "NO_ACTIVE_DEVICE"}})
+
+
+class SnapshotTests(TestCase):
+    """Snapshots are used on the event loop, where lazy queries fail."""
+
+    def setUp(self):
+        """One integration with a Spotify authorization."""
+
+        user = User.objects.create(username="streamer", first_name="Streamer")
+        SpotifyAuthorization.objects.create(
+            user=user,
+            access_token="access",
+            refresh_token="refresh",
+            token_type="Bearer",
+            expires_in=3600,
+            scope="")
+        TwitchIntegration.objects.create(user=user, twitch_id="1", twitch_login="streamer", add_to_queue=True)
+
+    def test_no_active_device_on_event_loop(self):
+        """The error names the streamer without querying their user."""
+
+        snapshot, = load_snapshots(TwitchIntegration.objects.all())
+
+        async def queue():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(no_active_device))
+            with mock.patch("core.models.get_async_client", return_value=client):
+                await snapshot.get_spotify().aadd_item_to_queue("spotify:track:1")
+
+        with self.assertRaisesMessage(UsageError, "Streamer isn't listening to Spotify right now!"):
+            asyncio.run(queue())
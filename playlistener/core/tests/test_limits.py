@@ -0,0 +1,85 @@
+from django.test import SimpleTestCase
+
+from unittest import mock
+
+from common.limits import RequestScheduler, TokenBucket
+
+
+class TokenBucketTests(SimpleTestCase):
+    """Reservations against a single bucket."""
+
+    def setUp(self):
+        """A bucket that's been full since time zero."""
+
+        with mock.patch("time.monotonic", return_value=0.0):
+            self.bucket = TokenBucket(rate=2, capacity=2)
+
+    def test_burst_then_wait(self):
+        """Capacity is free, then reservations queue at the rate."""
+
+        self.assertEqual(self.bucket.reserve(0.0), 0.0)
+        self.assertEqual(self.bucket.reserve(0.0), 0.0)
+        self.assertEqual(self.bucket.reserve(0.0), 0.5)
+        self.assertEqual(self.bucket.reserve(0.0), 1.0)
+
+    def test_refill_is_capped(self):
+        """An idle bucket doesn't save up more than its capacity."""
+
+        self.bucket.reserve(0.0)
+        self.bucket.reserve(0.0)
+        self.bucket.reserve(100.0)
+        self.bucket.reserve(100.0)
+        self.assertEqual(self.bucket.reserve(100.0), 0.5)
+
+    def test_refund(self):
+        """A refunded token can be reserved again."""
+
+        self.bucket.reserve(0.0)
+        self.bucket.reserve(0.0)
+        self.bucket.refund()
+        self.assertEqual(self.bucket.reserve(0.0), 0.0)
+
+    def test_pause(self):
+        """Reservations are held until a pause ends."""
+
+        with mock.patch("time.monotonic", return_value=0.0):
+            self.bucket.pause(5)
+        self.assertEqual(self.bucket.reserve(1.0), 4.0)
+        self.assertEqual(self.bucket.reserve(6.0), 0.0)
+
+
+class RequestSchedulerTests(SimpleTestCase):
+    """Reservations against the overall and per-key buckets."""
+
+    def setUp(self):
+        """A scheduler whose keys are stricter than the whole."""
+
+        self.scheduler = RequestScheduler(rate=100, capacity=100, key_rate=1, key_capacity=1)
+
+    def test_keys_are_separate(self):
+        """One key's burst doesn't delay another's."""
+
+        self.assertEqual(self.scheduler.reserve("a"), 0.0)
+        self.assertGreater(self.scheduler.reserve("a"), 0.0)
+        self.assertEqual(self.scheduler.reserve("b"), 0.0)
+
+    def test_refused_past_timeout(self):
+        """A wait longer than the timeout is refused and its tokens returned."""
+
+        self.scheduler.reserve("a")
+        self.assertIsNone(self.scheduler.reserve("a", timeout=0.1))
+        self.assertIsNone(self.scheduler.reserve("a", timeout=0.1))
+        self.assertFalse(self.scheduler.wait("a", timeout=0.1))
+
+        stats = self.scheduler.stats()
+        self.assertEqual(stats["refusals"], 3)
+        self.assertEqual(stats["waits"], 0)
+        self.assertEqual(stats["waiting"], 0)
+        self.assertLess(self.scheduler.reserve("a"), 1.5)
+
+    def test_pause_everyone(self):
+        """A pause without a key holds every key."""
+
+        self.scheduler.pause(60)
+        self.assertIsNone(self.scheduler.reserve("a", timeout=1))
+        self.assertIsNone(self.scheduler.reserve("b", timeout=1))
@@ -0,0 +1,116 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+import httpx
+from unittest import mock
+
+from core.models import SPOTIFY_THROTTLE_ATTEMPTS, SpotifyAuthorization, spotify_circuits
+from common.errors import InternalError, UnavailableError
+from common.limits import RequestScheduler
+
+
+class SendTests(TestCase):
+    """Throttling and failure handling of Spotify API requests."""
+
+    def setUp(self):
+        """An authorization that won't need refreshing."""
+
+        user = User.objects.create(username="streamer", first_name="Streamer")
+        self.spotify = SpotifyAuthorization.objects.create(
+            user=user,
+            access_token="access",
+            refresh_token="refresh",
+            token_type="Bearer",
+            expires_in=3600,
+            scope="")
+        self.requests = []
+
+    def patch_client(self, handler):
+        """Send the synchronous client's requests to handler."""
+
+        def record(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            return handler(request)
+
+        client = httpx.Client(transport=httpx.MockTransport(record))
+        return mock.patch("core.models.get_client", return_value=client)
+
+    def test_throttled_until_out_of_attempts(self):
+        """Persistent 429s become a busy error that doesn't trip the circuit."""
+
+        with self.patch_client(lambda request: httpx.Response(429, headers={"Retry-After": "0"})):
+            with self.assertRaisesMessage(UnavailableError, "Spotify is busy"):
+                self.spotify.send("GET", "/me")
+
+        self.assertEqual(len(self.requests), SPOTIFY_THROTTLE_ATTEMPTS)
+        self.assertNotIn(self.spotify.user_id, spotify_circuits.failures)
+
+    def test_throttled_then_sent(self):
+        """A request is retried after a 429."""
+
+        responses = iter([httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(200, json={})])
+        with self.patch_client(lambda request: next(responses)):
+            self.assertEqual(self.spotify.send("GET", "/me").status_code, 200)
+
+        self.assertEqual(len(self.requests), 2)
+
+    def test_turn_past_deadline(self):
+        """A request that can't get a turn in time fails without waiting."""
+
+        scheduler = RequestScheduler(rate=10, capacity=30, key_rate=3, key_capacity=10)
+        scheduler.pause(60)
+        with mock.patch("core.models.spotify_requests", scheduler):
+            with self.patch_client(lambda request: httpx.Response(200, json={})):
+                with self.assertRaisesMessage(UnavailableError, "Spotify is busy"):
+                    self.spotify.send("GET", "/me")
+
+        self.assertEqual(self.requests, [])
+        self.assertEqual(scheduler.stats()["refusals"], 1)
+
+
+class RefreshTests(TestCase):
+    """Refreshing Spotify tokens."""
+
+    def setUp(self):
+        """An authorization refreshed a while ago."""
+
+        user = User.objects.create(username="streamer", first_name="Streamer")
+        self.refreshed = timezone.now() - timezone.timedelta(hours=2)
+        self.spotify = SpotifyAuthorization.objects.create(
+            user=user,
+            access_token="access",
+            refresh_token="refresh",
+            token_type="Bearer",
+            expires_in=3600,
+            scope="",
+            time_refreshed=self.refreshed)
+
+    def refresh(self, response: httpx.Response):
+        """Refresh against a canned token response."""
+
+        client = httpx.Client(transport=httpx.MockTransport(lambda request: response))
+        with mock.patch("core.models.get_client", return_value=client):
+            self.spotify.refresh()
+
+    def test_refreshed(self):
+        """A successful refresh restarts the token's lifetime."""
+
+        self.refresh(httpx.Response(200, json={
+            "access_token": "fresh",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "scope": ""}))
+
+        self.assertEqual(self.spotify.access_token, "fresh")
+        self.assertGreater(self.spotify.time_refreshed, self.refreshed)
+        self.assertFalse(self.spotify.expired())
+
+    def test_refresh_rejected(self):
+        """A failed refresh leaves the token expired."""
+
+        with self.assertRaises(InternalError):
+            self.refresh(httpx.Response(400, json={"error": "invalid_grant"}))
+
+        self.assertEqual(self.spotify.time_refreshed, self.refreshed)
+        self.assertTrue(self.spotify.expired())
@@ -0,0 +1,85 @@
+from django.test import SimpleTestCase
+
+from common.wheel import TimingWheel
+
+
+class TimingWheelTests(SimpleTestCase):
+    """Expiry of cooldowns on a small wheel.
+
+    With 4 slots of 1 second and 3 levels, the levels reach 4, 16 and
+    64 seconds ahead, so the boundaries are easy to cross.
+    """
+
+    def setUp(self):
+        """A wheel starting at time zero."""
+
+        self.wheel = TimingWheel(1.0, 0.0, size=4, depth=3)
+
+    def expire(self, until: int) -> dict:
+        """Advance a second at a time, recording when each key expired."""
+
+        expired = {}
+        for now in range(1, until + 1):
+            for key in self.wheel.advance(now):
+                expired[key] = now
+        return expired
+
+    def test_expires_on_time(self):
+        """Keys expire at the first tick at or after their time."""
+
+        self.wheel.schedule("soon", 2.0)
+        self.wheel.schedule("between", 2.5)
+        self.assertEqual(self.expire(5), {"soon": 2, "between": 3})
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_across_levels(self):
+        """Keys cascade down from higher levels and expire on time."""
+
+        times = [1, 3, 4, 5, 15, 16, 17, 40, 63, 64, 65, 100, 200]
+        for when in times:
+            self.wheel.schedule(when, float(when))
+
+        self.assertEqual(self.expire(250), {when: when for when in times})
+
+    def test_advance_in_jumps(self):
+        """Skipping many ticks at once still expires everything due."""
+
+        for when in (3, 20, 70):
+            self.wheel.schedule(when, float(when))
+
+        self.assertEqual(self.wheel.advance(19), [3])
+        self.assertEqual(self.wheel.advance(100), [20, 70])
+
+    def test_past(self):
+        """Keys scheduled in the past expire on the next tick."""
+
+        self.wheel.advance(10)
+        self.wheel.schedule("late", 5.0)
+        self.assertEqual(self.wheel.advance(11), ["late"])
+
+    def test_cancel(self):
+        """Cancelled keys never expire."""
+
+        self.wheel.schedule("kept", 30.0)
+        self.wheel.schedule("cancelled", 30.0)
+        self.assertTrue(self.wheel.cancel("cancelled"))
+        self.assertFalse(self.wheel.cancel("cancelled"))
+        self.assertNotIn("cancelled", self.wheel)
+
+        self.assertEqual(self.expire(40), {"kept": 30})
+
+    def test_cancel_after_cascade(self):
+        """A key can be cancelled after moving down a level."""
+
+        self.wheel.schedule("key", 30.0)
+        self.assertEqual(self.expire(28), {})
+        self.assertTrue(self.wheel.cancel("key"))
+        self.assertEqual(self.expire(40), {})
+
+    def test_reschedule(self):
+        """Scheduling a key again replaces its expiry."""
+
+        self.wheel.schedule("key", 30.0)
+        self.wheel.schedule("key", 5.0)
+        self.assertEqual(len(self.wheel), 1)
+        self.assertEqual(self.expire(40), {"key": 5})
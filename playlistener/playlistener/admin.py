@@ -7,6 +7,8 @@ from django.conf import settings
 
 import requests
 
+from common.http import TIMEOUT_SECONDS
+
 
 def view_oauth_twitch(request: HttpRequest) -> HttpResponse:
     """Show code from Twitch verification."""
@@ -16,7 +18,7 @@ def view_oauth_twitch(request: HttpRequest) -> HttpResponse:
         "client_secret": settings.TWITCH_CLIENT_SECRET,
         "code": request.GET["code"],
         "grant_type": "authorization_code",
-        "redirect_uri": settings.TWITCH_REDIRECT_URI}).json()
+        "redirect_uri": settings.TWITCH_REDIRECT_URI}, timeout=TIMEOUT_SECONDS).json()
 
     return render(request, "admin/oauth/twitch.html", context=dict(data=data))
 
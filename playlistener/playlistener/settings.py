@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 
 from pathlib import Path
 
+from common.database import sqlite
+
 # Build paths inside the project like this: BASE_DIR / "subdir".
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -69,11 +71,11 @@ WSGI_APPLICATION = "playlistener.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# SQLite is tuned for concurrent access when connections open, see
+# common.database; use common.database.postgres locally to switch.
+
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": sqlite(BASE_DIR / "db.sqlite3"),
 }
 
 
@@ -136,6 +138,16 @@ LOGIN_REDIRECT_URL = "core:index"
 LOGOUT_REDIRECT_URL = "core:login"
 
 
+# Spotify track metadata cache, kept outside the application database
+
+TRACK_CACHE_PATH = BASE_DIR / "tracks.sqlite3"
+
+
+# Shared with Twitch when subscribing to EventSub webhooks, set locally
+
+TWITCH_EVENTSUB_SECRET = None
+
+
 # Local configuration
 
 from .local import *